@@ -1,24 +1,62 @@
 import asyncio
-import json
-import hashlib
 import logging
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+
+# bytes.translate table folding ASCII A-Z to a-z, built once
+_ASCII_LOWER = bytes.maketrans(bytes(range(256)), bytes(range(256)).lower())
+
+
+def _normalize_query(query: str) -> bytes:
+    """Strip and lowercase a query for use in a cache key.
+    
+    ASCII queries (the common case) are folded with a prebuilt translate
+    table; anything else goes through str.lower() to keep Unicode folding.
+    """
+    query = query.strip()
+    if query.isascii():
+        return query.encode("ascii").translate(_ASCII_LOWER)
+    return query.lower().encode("utf-8")
+
+
+def _freeze(obj: Any) -> Any:
+    """Recursively convert dicts and lists into hashable, order-stable tuples."""
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
 class CacheManager:
-    def __init__(self, redis_config: dict, ttl_seconds: int = 3600):
+    def __init__(self, redis_config: dict, ttl_seconds: int = 3600, max_entries: int = 1024):
         self.redis_config = redis_config
         self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
         self.redis_client = None
         self.is_enabled = False
+        # Guards cache_store mutation; the get/set paths are synchronous so
+        # they can be called from the event loop or worker threads.
+        self._lock = threading.Lock()
+        # In-flight computations per cache key, so concurrent misses for the
+        # same query share one upstream call instead of stampeding it.
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        # Bumped by invalidate_instance, so a computation that started before
+        # a write to its instance doesn't store a now-stale answer
+        self._generations: Dict[str, int] = {}
         
     async def initialize(self):
         """Initialize cache - simplified version without Redis for now."""
         try:
-            # For now, just enable in-memory caching
-            self.cache_store = {}
+            # For now, just enable in-memory caching.
+            # Entries are (expires_at, data) in LRU order, oldest first.
+            self.cache_store: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
             self.is_enabled = True
             logger.info("✅ Basic cache initialized (in-memory)")
         except Exception as e:
@@ -29,33 +67,53 @@ class CacheManager:
         """Close cache connections."""
         pass
     
-    def _generate_cache_key(self, query: str, instance_url: str, user_context: Dict = None) -> str:
-        """Generate a cache key."""
-        key_data = {
-            "query": query.strip().lower(),
-            "instance": instance_url,
-            "context": user_context or {}
-        }
-        key_string = json.dumps(key_data, sort_keys=True)
-        return hashlib.sha256(key_string.encode()).hexdigest()[:16]
+    def key_for(self, query: str, instance_url: str, user_context: Dict = None) -> Tuple:
+        """Generate a cache key.
+        
+        The cache is process-local, so the normalized inputs are used directly
+        as a hashable tuple instead of being serialized and digested. Callers
+        that both look up and store a query can compute this once and pass it
+        as ``cache_key`` to both calls.
+        """
+        return (
+            _normalize_query(query),
+            instance_url,
+            _freeze(user_context) if user_context else ()
+        )
     
-    async def get_cached_response(
+    def get_cached_response(
         self, 
         query: str, 
         instance_url: str, 
         user_context: Dict = None,
-        similarity_threshold: float = 0.85
+        similarity_threshold: float = 0.85,
+        cache_key: Optional[Tuple] = None
     ) -> Optional[Dict[str, Any]]:
-        """Get cached response."""
+        """Get cached response.
+        
+        Synchronous on purpose: a hit is a dict lookup, so callers skip the
+        coroutine round-trip.
+        """
         if not self.is_enabled:
             return None
         
         try:
-            cache_key = self._generate_cache_key(query, instance_url, user_context)
-            cached_data = self.cache_store.get(cache_key)
+            if cache_key is None:
+                cache_key = self.key_for(query, instance_url, user_context)
+            with self._lock:
+                entry = self.cache_store.get(cache_key)
+                if entry:
+                    expires_at, cached_data = entry
+                    if expires_at > time.monotonic():
+                        self.cache_store.move_to_end(cache_key)
+                    else:
+                        del self.cache_store[cache_key]
+                        cached_data = None
+                else:
+                    cached_data = None
             
             if cached_data:
-                logger.info(f"🎯 Cache HIT: {cache_key[:20]}...")
+                logger.info(f"🎯 Cache HIT: {query[:50]}...")
                 return cached_data
             
             logger.info(f"💨 Cache MISS: {query[:50]}...")
@@ -65,38 +123,142 @@ class CacheManager:
             logger.error(f"Cache retrieval error: {e}")
             return None
     
-    async def cache_response(
+    def _make_cache_data(
+        self,
+        query: str,
+        response: str,
+        instance_url: str,
+        user_context: Dict = None,
+        metadata: Dict = None
+    ) -> Dict[str, Any]:
+        """Build the entry stored for a cached response."""
+        return {
+            "query": query,
+            "response": response,
+            "instance_url": instance_url,
+            "user_context": user_context or {},
+            "metadata": metadata or {},
+            # Epoch seconds; formatted only when shown (see cached_at_iso)
+            "cached_at": time.time()
+        }
+    
+    @staticmethod
+    def cached_at_iso(cache_data: Dict[str, Any]) -> Optional[str]:
+        """ISO-8601 form of an entry's ``cached_at`` for API responses."""
+        cached_at = cache_data.get("cached_at")
+        if cached_at is None:
+            return None
+        return datetime.fromtimestamp(cached_at).isoformat()
+    
+    def cache_response(
         self, 
         query: str, 
         response: str, 
         instance_url: str, 
         user_context: Dict = None,
-        metadata: Dict = None
+        metadata: Dict = None,
+        cache_key: Optional[Tuple] = None
     ) -> bool:
         """Cache the response."""
         if not self.is_enabled:
             return False
         
         try:
-            cache_key = self._generate_cache_key(query, instance_url, user_context)
+            if cache_key is None:
+                cache_key = self.key_for(query, instance_url, user_context)
             
-            cache_data = {
-                "query": query,
-                "response": response,
-                "instance_url": instance_url,
-                "user_context": user_context or {},
-                "metadata": metadata or {},
-                "cached_at": datetime.now().isoformat()
-            }
+            cache_data = self._make_cache_data(query, response, instance_url, user_context, metadata)
             
-            self.cache_store[cache_key] = cache_data
-            logger.info(f"💾 Cached response: {cache_key[:20]}...")
+            with self._lock:
+                self.cache_store[cache_key] = (time.monotonic() + self.ttl_seconds, cache_data)
+                self.cache_store.move_to_end(cache_key)
+                while len(self.cache_store) > self.max_entries:
+                    self.cache_store.popitem(last=False)
+            logger.info(f"💾 Cached response: {query[:50]}...")
             return True
             
         except Exception as e:
             logger.error(f"Cache storage error: {e}")
             return False
     
+    async def get_or_compute(
+        self,
+        query: str,
+        instance_url: str,
+        compute: Callable[[], Awaitable[str]],
+        user_context: Dict = None,
+        metadata: Dict = None,
+        should_cache: Optional[Callable[[], bool]] = None,
+        refresh: bool = False
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Return the cached entry for a query, computing it at most once.
+        
+        On a miss the first caller runs ``compute()`` and caches the result;
+        concurrent callers for the same key await that same computation, and
+        one of them takes over if the first caller is cancelled.
+        ``should_cache`` is checked after ``compute()`` returns and can veto
+        storing the result (e.g. when the computation changed CRM data).
+        Waiters only share a result that was cached; after a vetoed run
+        each of them runs ``compute()`` itself, one at a time.
+        ``refresh`` skips the cached entry; the fresh result still replaces it.
+        
+        Returns:
+            (cache_data, was_cached) in the same shape as cached entries.
+        """
+        if not self.is_enabled:
+            response = await compute()
+            return self._make_cache_data(query, response, instance_url, user_context, metadata), False
+        
+        cache_key = self.key_for(query, instance_url, user_context)
+        if not refresh:
+            cached_data = self.get_cached_response(
+                query, instance_url, user_context, cache_key=cache_key
+            )
+            if cached_data:
+                return cached_data, True
+        
+        while (inflight := self._inflight.get(cache_key)) is not None:
+            logger.info(f"⏳ Awaiting in-flight computation: {query[:50]}...")
+            try:
+                shared = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The computing caller was cancelled (its client went away);
+                # take over unless this caller is being cancelled as well
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                continue
+            # None means the run wasn't cacheable (e.g. it wrote to the CRM);
+            # its result belongs to that caller alone, so run our own
+            if shared is not None:
+                return shared, False
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        generation = self._generations.get(instance_url, 0)
+        try:
+            response = await compute()
+            cache_data = self._make_cache_data(query, response, instance_url, user_context, metadata)
+            cacheable = (
+                (should_cache is None or should_cache())
+                and self._generations.get(instance_url, 0) == generation
+            )
+            if cacheable:
+                self.cache_response(
+                    query, response, instance_url, user_context, metadata, cache_key=cache_key
+                )
+            future.set_result(cache_data if cacheable else None)
+            return cache_data, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[cache_key]
+    
     async def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
         if not self.is_enabled:
@@ -105,17 +267,51 @@ class CacheManager:
         return {
             "enabled": True,
             "total_keys": len(self.cache_store),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
             "cache_type": "in-memory"
         }
     
+    def invalidate_instance(self, instance_url: str) -> int:
+        """Drop every cached answer for a CRM instance, e.g. after a write to it.
+        
+        Answers still being computed for the instance are not stored either.
+        Returns the number of entries removed.
+        """
+        self._generations[instance_url] = self._generations.get(instance_url, 0) + 1
+        if not self.is_enabled:
+            return 0
+        with self._lock:
+            stale = [key for key in self.cache_store if key[1] == instance_url]
+            for key in stale:
+                del self.cache_store[key]
+        if stale:
+            logger.info(f"🗑️ Invalidated {len(stale)} cached responses for {instance_url}")
+        return len(stale)
+    
     async def clear_cache(self, pattern: str = "") -> int:
-        """Clear cache entries."""
+        """Clear cache entries.
+        
+        With no pattern everything is cleared; otherwise only entries whose
+        query or instance URL contains the pattern (case-insensitive).
+        """
         if not self.is_enabled:
             return 0
         
         try:
-            count = len(self.cache_store)
-            self.cache_store.clear()
+            with self._lock:
+                if not pattern:
+                    count = len(self.cache_store)
+                    self.cache_store.clear()
+                else:
+                    needle = pattern.lower()
+                    matching = [
+                        key for key, (_, data) in self.cache_store.items()
+                        if needle in data["query"].lower() or needle in data["instance_url"].lower()
+                    ]
+                    for key in matching:
+                        del self.cache_store[key]
+                    count = len(matching)
             logger.info(f"🗑️ Cleared {count} cache entries")
             return count
         except Exception as e:
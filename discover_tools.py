@@ -9,11 +9,31 @@ from an MCP server without needing the full FastAPI application.
 import asyncio
 import sys
 import os
+from functools import lru_cache
 from pathlib import Path
 
 # Add the current directory to Python path to import from servers
 sys.path.append(str(Path(__file__).parent))
 
+
+@lru_cache(maxsize=None)
+def _model_schema(model):
+    """JSON schema for a Pydantic model, generated once per model class."""
+    if hasattr(model, "model_json_schema"):
+        return model.model_json_schema()
+    return model.schema()
+
+
+def _schema(args_schema):
+    """JSON schema for a tool's args_schema.
+
+    MCP-loaded tools already carry the input schema as a plain dict; only
+    Pydantic models need generating (and caching)."""
+    if isinstance(args_schema, dict):
+        return args_schema
+    return _model_schema(args_schema)
+
+
 async def discover_tools():
     """Discover and list all available MCP tools."""
     try:
@@ -59,7 +79,7 @@ async def discover_tools():
                 
                 # Show schema if available
                 if hasattr(tool, 'args_schema') and tool.args_schema:
-                    schema = tool.args_schema.schema()
+                    schema = _schema(tool.args_schema)
                     if schema.get('properties'):
                         print(f"    Parameters:")
                         for param_name, param_info in schema['properties'].items():
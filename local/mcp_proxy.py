@@ -1,14 +1,24 @@
 import sys
 import os
-import json
+import asyncio
+import functools
+import threading
+import time
+import orjson
 import requests
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from requests.adapters import HTTPAdapter
 
 CLOUD_RUN_URL = os.environ.get("SERVER_URL")
 INSITES_INSTANCE_URL = os.environ.get("INSITES_INSTANCE_URL")
 INSITES_INSTANCE_API_KEY = os.environ.get("INSITES_INSTANCE_API_KEY")
 CONSOLE_EMAIL = os.environ.get("CONSOLE_EMAIL", "") 
 
+RequestId = Union[int, str, None]
+Params = Dict[str, Any]
+
 if not CLOUD_RUN_URL:
     print("SERVER_URL (Cloud Run URL) is not set", file=sys.stderr)
     sys.exit(1)
@@ -16,27 +26,97 @@ if not CLOUD_RUN_URL:
 # Ensure URL doesn't end with /
 CLOUD_RUN_URL = CLOUD_RUN_URL.rstrip('/')
 
+# Request targets and payloads that don't change between calls
+_TOOLS_LIST_URL = f"{CLOUD_RUN_URL}/mcp/tools/list"
+_TOOLS_CALL_URL = f"{CLOUD_RUN_URL}/mcp/tools/call"
+# tools/list sends the credentials as its JSON body, tools/call as query params
+_CREDENTIALS = {
+    "instance_url": INSITES_INSTANCE_URL,
+    "instance_api_key": INSITES_INSTANCE_API_KEY
+}
+_TOOLS_LIST_BODY = orjson.dumps(_CREDENTIALS)
+_INSTANCE_TOOLS = frozenset({"validate_subdomain", "create_instance"})
+_INSTANCE_EXTRAS = {"console_email": CONSOLE_EMAIL} if CONSOLE_EMAIL else {}
+
+# Shared session so every tool call reuses a pooled keep-alive connection to
+# Cloud Run instead of paying a fresh TCP + TLS handshake per request
+SESSION = requests.Session()
+SESSION.headers.update({"Content-Type": "application/json"})
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Requests are handled concurrently, one worker per pooled connection
+MAX_IN_FLIGHT = 16
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="mcp-proxy")
+
+STDIN_CHUNK_SIZE = 65536
+
+# The tool catalog is near-static, so tools/list answers from memory for a while
+_TOOLS_TTL = 60
+_TOOLS_CACHE: Optional[Tuple[float, List[Any]]] = None  # (expires_at, tools)
+
+# Keeps each JSON-RPC frame atomic when several workers respond at once
+_WRITE_LOCK = threading.Lock()
+
+_OUT = sys.stdout.buffer
+
+# Set while run() is active; responses then share one flush per loop iteration
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_flush_scheduled = False
+
 
-def send_error(request_id, code, message, data=None):
+def write_message(message: Dict[str, Any]) -> None:
+    """Write one newline-delimited JSON-RPC message to stdout as bytes"""
+    global _flush_scheduled
+    frame = orjson.dumps(message) + b"\n"
+    with _WRITE_LOCK:
+        _OUT.write(frame)
+        if _loop is None:
+            _OUT.flush()
+            return
+        if _flush_scheduled:
+            return
+        _flush_scheduled = True
+    # Coalesce: every frame written before the loop gets to this callback
+    # goes out with a single flush
+    _loop.call_soon_threadsafe(flush_output)
+
+
+def flush_output() -> None:
+    """Flush buffered responses to stdout"""
+    global _flush_scheduled
+    with _WRITE_LOCK:
+        _flush_scheduled = False
+        _OUT.flush()
+
+
+def body_preview(response: requests.Response) -> str:
+    """First 200 bytes of a response body for error messages, decoded without
+    materializing the whole body as text"""
+    return response.content[:200].decode("utf-8", "replace")
+
+
+def send_error(request_id: RequestId, code: int, message: str, data: Any = None) -> None:
     """Send a JSON-RPC 2.0 compliant error response"""
     # Don't send error responses for notifications (requests without id)
     if request_id is None:
         return
     
+    error: Dict[str, Any] = {
+        "code": code,
+        "message": message
+    }
+    if data is not None:
+        error["data"] = data
     error_response = {
         "jsonrpc": "2.0",
         "id": request_id,
-        "error": {
-            "code": code,
-            "message": message
-        }
+        "error": error
     }
-    if data is not None:
-        error_response["error"]["data"] = data
-    print(json.dumps(error_response), flush=True)
+    write_message(error_response)
 
 
-def send_response(request_id, result):
+def send_response(request_id: RequestId, result: Dict[str, Any]) -> None:
     """Send a JSON-RPC 2.0 compliant success response"""
     # Don't send responses for notifications (requests without id)
     if request_id is None:
@@ -47,10 +127,10 @@ def send_response(request_id, result):
         "id": request_id,
         "result": result
     }
-    print(json.dumps(response), flush=True)
+    write_message(response)
 
 
-def handle_initialize(request_id, params):
+def handle_initialize(request_id: RequestId, params: Params) -> None:
     """Handle MCP initialize method"""
     return send_response(request_id, {
         "protocolVersion": "2024-11-05",
@@ -64,9 +144,16 @@ def handle_initialize(request_id, params):
     })
 
 
-def handle_tools_list(request_id, params):
+def handle_tools_list(request_id: RequestId, params: Params) -> None:
     """Handle MCP tools/list method by calling Cloud Run REST API"""
+    global _TOOLS_CACHE
     try:
+        cached = _TOOLS_CACHE
+        if cached is not None and cached[0] > time.monotonic():
+            return send_response(request_id, {
+                "tools": cached[1]
+            })
+
         if not INSITES_INSTANCE_URL or not INSITES_INSTANCE_API_KEY:
             return send_error(
                 request_id,
@@ -75,13 +162,9 @@ def handle_tools_list(request_id, params):
             )
         
         # Call the Cloud Run REST endpoint with required credentials
-        response = requests.post(
-            f"{CLOUD_RUN_URL}/mcp/tools/list",
-            json={
-                "instance_url": INSITES_INSTANCE_URL,
-                "instance_api_key": INSITES_INSTANCE_API_KEY
-            },
-            headers={"Content-Type": "application/json"},
+        response = SESSION.post(
+            _TOOLS_LIST_URL,
+            data=_TOOLS_LIST_BODY,
             timeout=60
         )
         
@@ -90,16 +173,16 @@ def handle_tools_list(request_id, params):
             return send_error(
                 request_id,
                 -32000,
-                f"HTTP {response.status_code}: {response.text[:200]}"
+                f"HTTP {response.status_code}: {body_preview(response)}"
             )
         
         try:
-            data = response.json()
-        except json.JSONDecodeError:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
             return send_error(
                 request_id,
                 -32000,
-                f"Invalid JSON response from server: {response.text[:200]}"
+                f"Invalid JSON response from server: {body_preview(response)}"
             )
         
         # Convert REST API response to MCP format
@@ -109,6 +192,8 @@ def handle_tools_list(request_id, params):
             tools = data
         else:
             tools = []
+
+        _TOOLS_CACHE = (time.monotonic() + _TOOLS_TTL, tools)
         
         return send_response(request_id, {
             "tools": tools
@@ -127,7 +212,7 @@ def handle_tools_list(request_id, params):
         )
 
 
-def handle_tools_call(request_id, params):
+def handle_tools_call(request_id: RequestId, params: Params) -> None:
     """Handle MCP tools/call method by calling Cloud Run REST API"""
     try:
         tool_name = params.get("name")
@@ -141,8 +226,7 @@ def handle_tools_call(request_id, params):
             )
         
         # Check if this is an instance management tool
-        instance_tools = ["validate_subdomain", "create_instance"]
-        is_instance_tool = tool_name in instance_tools
+        is_instance_tool = tool_name in _INSTANCE_TOOLS
 
         if not INSITES_INSTANCE_URL or not INSITES_INSTANCE_API_KEY:
             return send_error(
@@ -151,30 +235,22 @@ def handle_tools_call(request_id, params):
                 "INSITES_INSTANCE_URL and INSITES_INSTANCE_API_KEY environment variables must be set for CRM tools"
             )
         
-        # Prepare query parameters and request body
-        query_params = {}
-        request_body = {
-            "name": tool_name,
-            "arguments": arguments.copy()  # Make a copy so we don't modify the original
-        }
-        
-        # # Add credentials to request based on tool type
+        # Add credentials to request based on tool type. CRM tools forward the
+        # caller's arguments untouched, so they don't need a copy
         if is_instance_tool:
-            # For instance tools, add AWS credentials and console credentials to arguments
-            if CONSOLE_EMAIL:
-                request_body["arguments"]["console_email"] = CONSOLE_EMAIL
+            # For instance tools, add console credentials to arguments
+            arguments = {**arguments, **_INSTANCE_EXTRAS}
 
-        query_params = {
-            "instance_url": INSITES_INSTANCE_URL,
-            "instance_api_key": INSITES_INSTANCE_API_KEY
+        request_body = {
+            "name": tool_name,
+            "arguments": arguments
         }
         
         # Call the Cloud Run REST endpoint
-        response = requests.post(
-            f"{CLOUD_RUN_URL}/mcp/tools/call",
+        response = SESSION.post(
+            _TOOLS_CALL_URL,
             json=request_body,
-            params=query_params,
-            headers={"Content-Type": "application/json"},
+            params=_CREDENTIALS,
             timeout=60
         )
         
@@ -183,16 +259,16 @@ def handle_tools_call(request_id, params):
             return send_error(
                 request_id,
                 -32000,
-                f"HTTP {response.status_code}: {response.text[:200]}"
+                f"HTTP {response.status_code}: {body_preview(response)}"
             )
         
         try:
-            data = response.json()
-        except json.JSONDecodeError:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
             return send_error(
                 request_id,
                 -32000,
-                f"Invalid JSON response from server: {response.text[:200]}"
+                f"Invalid JSON response from server: {body_preview(response)}"
             )
         
         # Convert REST API response to MCP format
@@ -201,7 +277,7 @@ def handle_tools_call(request_id, params):
         else:
             content = [{
                 "type": "text",
-                "text": json.dumps(data, indent=2)
+                "text": orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
             }]
         
         return send_response(request_id, {
@@ -222,78 +298,146 @@ def handle_tools_call(request_id, params):
         )
 
 
-def main():
-    while True:
-        line = sys.stdin.readline()
+def handle_cancelled(request_id: RequestId, params: Params) -> None:
+    """Ignore cancellation notifications (they don't need responses)"""
+    return None
+
+
+HANDLERS: Dict[str, Callable[[RequestId, Params], None]] = {
+    "initialize": handle_initialize,
+    "tools/list": handle_tools_list,
+    "tools/call": handle_tools_call,
+    "notifications/cancelled": handle_cancelled,
+}
+
+
+def handle_line(line: bytes) -> None:
+    """Parse one JSON-RPC line from stdin and dispatch it to its handler"""
+    request_id = None
+    try:
+        # Parse the JSON-RPC request
+        line = line.strip()
         if not line:
-            break
+            return
 
-        request_id = None
-        try:
-            # Parse the JSON-RPC request
-            line = line.strip()
-            if not line:
-                continue
-                
-            request = json.loads(line)
-            request_id = request.get("id")
-            method = request.get("method")
-            params = request.get("params", {})
-            
-            # Check if this is a notification (id is null/None) - notifications don't get responses
-            is_notification = (request_id is None)
-            
-            # Validate request has required fields
-            if method is None:
-                # Only send error for non-notifications
-                if not is_notification:
-                    send_error(
-                        request_id,
-                        -32600,  # Invalid Request
-                        "Missing 'method' field"
-                    )
-                continue
-            
-            # Handle different MCP methods
-            if method == "initialize":
-                handle_initialize(request_id, params)
-            elif method == "tools/list":
-                handle_tools_list(request_id, params)
-            elif method == "tools/call":
-                handle_tools_call(request_id, params)
-            elif method == "notifications/cancelled":
-                # Ignore cancellation notifications (they don't need responses)
-                continue
-            else:
-                # Only send error for non-notifications
-                if not is_notification:
-                    send_error(
-                        request_id,
-                        -32601,  # Method not found
-                        f"Method not found: {method}"
-                    )
-
-        except json.JSONDecodeError as e:
-            # For parse errors, we might not have a valid request_id, so check first
-            # But parse errors are serious - log to stderr and only respond if we have an id
-            print(f"Parse error: {str(e)}", file=sys.stderr)
-            if request_id is not None:
-                send_error(
-                    request_id,
-                    -32700,  # Parse error
-                    f"Parse error: {str(e)}"
-                )
-        except Exception as e:
-            # Log to stderr for debugging
-            print(f"Internal error: {str(e)}", file=sys.stderr)
-            print(traceback.format_exc(), file=sys.stderr)
-            # Only send error response if we have a valid request_id
-            if request_id is not None:
+        request = orjson.loads(line)
+        request_id = request.get("id")
+        method = request.get("method")
+        params = request.get("params", {})
+        
+        # Check if this is a notification (id is null/None) - notifications don't get responses
+        is_notification = (request_id is None)
+        
+        # Validate request has required fields
+        if method is None:
+            # Only send error for non-notifications
+            if not is_notification:
                 send_error(
                     request_id,
-                    -32603,  # Internal error
-                    f"Internal error: {str(e)}"
+                    -32600,  # Invalid Request
+                    "Missing 'method' field"
                 )
+            return
+        
+        # Handle different MCP methods
+        handler = HANDLERS.get(method)
+        if handler is not None:
+            handler(request_id, params)
+        elif not is_notification:
+            # Only send error for non-notifications
+            send_error(
+                request_id,
+                -32601,  # Method not found
+                f"Method not found: {method}"
+            )
+
+    except orjson.JSONDecodeError as e:
+        # For parse errors, we might not have a valid request_id, so check first
+        # But parse errors are serious - log to stderr and only respond if we have an id
+        print(f"Parse error: {str(e)}", file=sys.stderr)
+        if request_id is not None:
+            send_error(
+                request_id,
+                -32700,  # Parse error
+                f"Parse error: {str(e)}"
+            )
+    except Exception as e:
+        # Log to stderr for debugging
+        print(f"Internal error: {str(e)}", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        # Only send error response if we have a valid request_id
+        if request_id is not None:
+            send_error(
+                request_id,
+                -32603,  # Internal error
+                f"Internal error: {str(e)}"
+            )
+
+
+async def open_stdin(loop: asyncio.AbstractEventLoop) -> Callable[[], Awaitable[bytes]]:
+    """Return a coroutine factory that reads the next raw stdin chunk without
+    blocking the event loop"""
+    try:
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+        )
+    except (NotImplementedError, ValueError, OSError):
+        # Windows event loops and redirected files can't be wrapped as a pipe,
+        # so fall back to blocking reads on a worker thread
+        return functools.partial(
+            loop.run_in_executor, None, os.read, sys.stdin.fileno(), STDIN_CHUNK_SIZE
+        )
+    return functools.partial(reader.read, STDIN_CHUNK_SIZE)
+
+
+def submit(loop: asyncio.AbstractEventLoop, pending: Set["asyncio.Future[None]"], line: bytes) -> None:
+    """Hand one frame to the worker pool and track it until it completes"""
+    future = loop.run_in_executor(EXECUTOR, handle_line, line)
+    pending.add(future)
+    future.add_done_callback(pending.discard)
+
+
+async def run() -> None:
+    """Dispatch every request as soon as it arrives so a slow tools/call
+    doesn't hold up the requests queued behind it"""
+    global _loop
+    loop = asyncio.get_running_loop()
+    pending: Set["asyncio.Future[None]"] = set()
+    _loop = loop
+
+    # Split stdin into newline-delimited frames, keeping them as bytes all the
+    # way to orjson.loads
+    read_chunk = await open_stdin(loop)
+    buf = bytearray()
+    while True:
+        chunk = await read_chunk()
+        if not chunk:
+            break
+        buf += chunk
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            submit(loop, pending, bytes(buf[start:nl]))
+            start = nl + 1
+        del buf[:start]
+
+    # Last frame may not be newline-terminated
+    if buf:
+        submit(loop, pending, bytes(buf))
+
+    # stdin closed - let in-flight requests finish writing their responses
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    _loop = None
+    flush_output()
+
+
+def main() -> None:
+    try:
+        asyncio.run(run())
+    finally:
+        EXECUTOR.shutdown(wait=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+"""
+Optional mypyc build for the local MCP proxy.
+
+    cd local
+    pip install mypy
+    python setup.py build_ext --inplace
+
+This leaves a compiled mcp_proxy extension next to mcp_proxy.py. Imports
+prefer the extension, so start the compiled proxy with:
+
+    python -c "import mcp_proxy; mcp_proxy.main()"
+
+Running `python mcp_proxy.py` (as start_server.sh does) keeps using the
+pure-Python source, which stays the fallback wherever mypyc isn't available.
+"""
+
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name="mcp-proxy",
+    py_modules=[],
+    ext_modules=mypycify(["mcp_proxy.py"]),
+)
@@ -1,25 +1,20 @@
 import asyncio
 import os
-import uuid
-import json
-import uvicorn
 import hashlib
-from datetime import datetime
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
-from langchain_core.messages import HumanMessage
-from langchain.agents import create_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from collections import defaultdict
-from typing import Dict, Any, Optional, List
-import httpx
+from typing import Dict, Any, Optional, List, Tuple, Union
 from pydantic import BaseModel
 import logging
+import orjson
 
 # Import tools directly
-from servers.crm_tools import CRMTools
+from servers.crm_tools import CRMTools, create_http_session
 from servers.instance_tools import InstanceTools
 
 # Configure logging for Cloud Run with proper formatting
@@ -40,6 +35,15 @@ GCP_REGION = os.getenv("GCP_REGION")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
 
 CONSOLE_EMAIL = os.getenv("CONSOLE_EMAIL", "")
+CRM_TOOLS_CACHE_SIZE = int(os.getenv("CRM_TOOLS_CACHE_SIZE", "512"))
+INSTANCE_TOOLS_CACHE_SIZE = int(os.getenv("INSTANCE_TOOLS_CACHE_SIZE", "128"))
+# Subdomain availability rarely changes within seconds, and clients check
+# the same name repeatedly while a user types or retries; 0 disables
+SUBDOMAIN_CACHE_TTL_SECONDS = float(os.getenv("SUBDOMAIN_CACHE_TTL_SECONDS", "5"))
+SUBDOMAIN_CACHE_SIZE = 1024
+# Threads for blocking work (CRM HTTP calls, Secret Manager); they mostly
+# wait on the network, so size well past the core count
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", str(min(64, (os.cpu_count() or 1) * 8))))
 
 def setup_credentials():
     """
@@ -88,9 +92,6 @@ def validate_environment():
     if not all([GCP_PROJECT_ID, GCP_REGION]):
         raise ValueError("GCP_PROJECT_ID and GCP_REGION must be set.")
 
-# --- Asynchronous Message Queues for Streaming ---
-message_queues: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
-
 # ============================================================================
 # PYDANTIC MODELS - MCP STANDARD
 # ============================================================================
@@ -134,8 +135,20 @@ class CallToolResponse(BaseModel):
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting MCP CRM Server...")
+
+    # asyncio.to_thread and run_in_executor(None, ...) use this pool
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="blocking")
+    )
+
+    # One pooled HTTP session shared by every CRMTools instance, with a
+    # connection per blocking thread
+    app.state.http_session = create_http_session(pool_maxsize=BLOCKING_THREADS)
+    # The Console/AWS gateway gets its own session, apart from tenant CRM traffic
+    app.state.console_http_session = create_http_session(pool_maxsize=BLOCKING_THREADS)
     
-    setup_credentials()
+    # setup_credentials checks the filesystem; keep it off the event loop
+    await asyncio.to_thread(setup_credentials)
     # Validate environment at startup (runtime)
     try:
         validate_environment()
@@ -143,11 +156,15 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Environment validation failed: {e}")
         app.state.llm = None
         yield
+        app.state.http_session.close()
+        app.state.console_http_session.close()
         return
     
     # Initialize LLM
     try:
         logger.info("🔧 Initializing LLM...")
+        # Imported here so module import (and the Docker import check) stays light
+        from langchain_google_genai import ChatGoogleGenerativeAI
         llm = ChatGoogleGenerativeAI(
             model=GEMINI_MODEL_NAME,
             temperature=0,
@@ -156,16 +173,16 @@ async def lifespan(app: FastAPI):
         )
         app.state.llm = llm
         logger.info("✅ LLM initialized successfully")
-    except Exception as e:
-        logger.error(f"❌ Error initializing LLM: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("❌ Error initializing LLM %s", GEMINI_MODEL_NAME, extra={"model": GEMINI_MODEL_NAME})
         app.state.llm = None
     
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down MCP CRM Server...")
+    app.state.http_session.close()
+    app.state.console_http_session.close()
 
 app = FastAPI(
     title="MCP CRM API",
@@ -174,384 +191,442 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# tools/list carries every tool's schema and tool results are JSON text;
+# both compress well
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+# CRMTools per credential pair, least recently used first. Keyed on a hash of
+# the API key so raw keys aren't used as cache keys.
+_crm_tools_cache: "OrderedDict[Tuple[str, bytes], CRMTools]" = OrderedDict()
+
+def get_crm_tools(instance_url: str, instance_api_key: str) -> CRMTools:
+    """Return the CRMTools for a credential pair, reusing it across requests."""
+    key = (instance_url, hashlib.sha256(instance_api_key.encode()).digest())
+    crm = _crm_tools_cache.get(key)
+    if crm is not None:
+        _crm_tools_cache.move_to_end(key)
+        return crm
+    crm = CRMTools(instance_url, instance_api_key, session=app.state.http_session)
+    _crm_tools_cache[key] = crm
+    if len(_crm_tools_cache) > CRM_TOOLS_CACHE_SIZE:
+        _crm_tools_cache.popitem(last=False)
+    return crm
+
+# CRM tool name -> CRMTools method, called as handler(crm, args)
+_CRM_DISPATCH = {
+    "get_contacts": CRMTools.get_contacts,
+    "get_companies": CRMTools.get_companies,
+    # Create and update are both a save; update includes the uuid
+    "create_contact": CRMTools.save_contact,
+    "update_contact": CRMTools.save_contact,
+    "create_company": CRMTools.create_company,
+    "update_company": CRMTools.update_company,
+}
+
+# Tools served by InstanceTools
+_INSTANCE_TOOLS = frozenset({"validate_subdomain", "create_instance"})
+
+# InstanceTools per console email, least recently used first
+_instance_tools_cache: "OrderedDict[str, InstanceTools]" = OrderedDict()
+
+def get_instance_tools(console_email: str) -> InstanceTools:
+    """Return the InstanceTools for a console email, reusing it across requests."""
+    instance_tools = _instance_tools_cache.get(console_email)
+    if instance_tools is not None:
+        _instance_tools_cache.move_to_end(console_email)
+        return instance_tools
+    instance_tools = InstanceTools(console_email=console_email, session=app.state.console_http_session)
+    _instance_tools_cache[console_email] = instance_tools
+    if len(_instance_tools_cache) > INSTANCE_TOOLS_CACHE_SIZE:
+        _instance_tools_cache.popitem(last=False)
+    return instance_tools
+
+# Successful validate_subdomain results: name -> (result, expires_at), oldest first
+_subdomain_cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+async def validate_subdomain_cached(instance_tools: InstanceTools, name: str) -> Dict[str, Any]:
+    """validate_subdomain through a short TTL cache of successful answers."""
+    now = time.monotonic()
+    cached = _subdomain_cache.get(name)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    result = await asyncio.to_thread(instance_tools.validate_subdomain, name=name)
+    # Errors aren't cached, so the next call retries the gateway
+    if SUBDOMAIN_CACHE_TTL_SECONDS > 0 and result.get("success"):
+        _subdomain_cache[name] = (result, time.monotonic() + SUBDOMAIN_CACHE_TTL_SECONDS)
+        _subdomain_cache.move_to_end(name)
+        if len(_subdomain_cache) > SUBDOMAIN_CACHE_SIZE:
+            _subdomain_cache.popitem(last=False)
+    return result
+
 def create_crm_tools(instance_url: str, instance_api_key: str):
     """Create CRM tools with the given instance credentials."""
-    crm_tools = CRMTools(instance_url, instance_api_key)
-    return crm_tools.get_langchain_tools()
+    return get_crm_tools(instance_url, instance_api_key).get_langchain_tools()
 
 # ============================================================================
 # MCP STANDARD ENDPOINTS
 # ============================================================================
 
-@app.post("/mcp/tools/list")
-async def mcp_list_tools(request: ToolsRequest) -> ToolsListResponse:
-    """
-    MCP standard endpoint: List all available tools.
-    This follows the MCP protocol specification.
-    """
-    try:
-        # Validate the instance credentials
-        crm_tools = CRMTools(request.instance_url, request.instance_api_key)
-
-    
-        return ToolsListResponse(
-            tools=[
-                # ========== CONTACT TOOLS ==========
-                Tool(
-                    name="get_contacts",
-                    description="Retrieves contacts from the CRM with pagination, sorting, and search. Returns a list of contact objects with id, email, first_name, last_name, and custom properties.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "page": {
-                                "type": "integer",
-                                "description": "Page number for pagination (default: 1)"
-                            },
-                            "size": {
-                                "type": "integer",
-                                "description": "Number of contacts per page (default: 10)"
-                            },
-                            "sort_by": {
-                                "type": "string",
-                                "description": "Field to sort by (e.g., 'last_name', 'first_name', 'email')"
-                            },
-                            "search_by": {
-                                "type": "string",
-                                "description": "Field to search in (e.g., 'first_name', 'last_name', 'email')"
-                            },
-                            "keyword": {
-                                "type": "string",
-                                "description": "Search keyword to filter contacts"
-                            },
-                            "sort_order": {
-                                "type": "string",
-                                "description": "Sort order: 'ASC' or 'DESC' (default: 'ASC')",
-                                "enum": ["ASC", "DESC"]
-                            }
-                        }
-                    }
-                ),
-                Tool(
-                    name="create_contact",
-                    description="Creates a new contact in the Insites CRM. Requires an email address at minimum. Use the 'properties' field to store additional details like phone numbers, job titles, or company names. If email already exists, this will fail - you should then search for the contact and use update_contact instead.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "email": {
-                                "type": "string",
-                                "description": "The email address of the new contact. Must be unique (required)."
-                            },
-                            "first_name": {
-                                "type": "string",
-                                "description": "The contact's first name"
-                            },
-                            "last_name": {
-                                "type": "string",
-                                "description": "The contact's last name"
-                            },
-                        },
-                        "required": ["email"]
+# The tool catalogue is static: build it once rather than on every
+# tools/list call.
+_TOOLS_LIST_RESPONSE = ToolsListResponse(
+    tools=[
+        # ========== CONTACT TOOLS ==========
+        Tool(
+            name="get_contacts",
+            description="Retrieves contacts from the CRM with pagination, sorting, and search. Returns a list of contact objects with id, email, first_name, last_name, and custom properties.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "page": {
+                        "type": "integer",
+                        "description": "Page number for pagination (default: 1)"
+                    },
+                    "size": {
+                        "type": "integer",
+                        "description": "Number of contacts per page (default: 10)"
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "description": "Field to sort by (e.g., 'last_name', 'first_name', 'email')"
+                    },
+                    "search_by": {
+                        "type": "string",
+                        "description": "Field to search in (e.g., 'first_name', 'last_name', 'email')"
+                    },
+                    "keyword": {
+                        "type": "string",
+                        "description": "Search keyword to filter contacts"
+                    },
+                    "sort_order": {
+                        "type": "string",
+                        "description": "Sort order: 'ASC' or 'DESC' (default: 'ASC')",
+                        "enum": ["ASC", "DESC"]
                     }
-                ),
-                Tool(
-                    name="update_contact",
-                    description="Updates the details of an existing contact in the Insites CRM. You must provide the contact's unique 'uuid'. If you only have an email, use 'get_contacts' with search first to retrieve the 'uuid'. Only fields you provide will be updated - others remain unchanged.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "uuid": {
-                                "type": "string",
-                                "description": "The unique UUID of the contact to update (required)"
-                            },
-                            "email": {
-                                "type": "string",
-                                "description": "New email address (optional, only if changing it)"
-                            },
-                            "first_name": {
-                                "type": "string",
-                                "description": "Updated first name (optional)"
-                            },
-                            "last_name": {
-                                "type": "string",
-                                "description": "Updated last name (optional)"
-                            },
-                        },
-                        "required": ["uuid"]
-                    }
-                ),
-
-                # ========== COMPANY TOOLS ==========
-                Tool(
-                    name="get_companies",
-                    description="Retrieves companies from the CRM with pagination, sorting, and search. Returns a list of company objects with uuid, company_name, and other details.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "page": {
-                                "type": "integer",
-                                "description": "Page number for pagination (default: 1)"
-                            },
-                            "size": {
-                                "type": "integer",
-                                "description": "Number of companies per page (default: 10)"
-                            },
-                            "sort_by": {
-                                "type": "string",
-                                "description": "Field to sort by (e.g., 'company_name', 'created_at')"
-                            },
-                            "search_by": {
-                                "type": "string",
-                                "description": "Field to search in (e.g., 'company_name')"
-                            },
-                            "keyword": {
-                                "type": "string",
-                                "description": "Search keyword to filter companies"
-                            },
-                            "sort_order": {
-                                "type": "string",
-                                "description": "Sort order: 'ASC' or 'DESC' (default: 'ASC')",
-                                "enum": ["ASC", "DESC"]
-                            }
-                        }
+                }
+            }
+        ),
+        Tool(
+            name="create_contact",
+            description="Creates a new contact in the Insites CRM. Requires an email address at minimum. Use the 'properties' field to store additional details like phone numbers, job titles, or company names. If email already exists, this will fail - you should then search for the contact and use update_contact instead.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "email": {
+                        "type": "string",
+                        "description": "The email address of the new contact. Must be unique (required)."
+                    },
+                    "first_name": {
+                        "type": "string",
+                        "description": "The contact's first name"
+                    },
+                    "last_name": {
+                        "type": "string",
+                        "description": "The contact's last name"
+                    },
+                },
+                "required": ["email"]
+            }
+        ),
+        Tool(
+            name="update_contact",
+            description="Updates the details of an existing contact in the Insites CRM. You must provide the contact's unique 'uuid'. If you only have an email, use 'get_contacts' with search first to retrieve the 'uuid'. Only fields you provide will be updated - others remain unchanged.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "uuid": {
+                        "type": "string",
+                        "description": "The unique UUID of the contact to update (required)"
+                    },
+                    "email": {
+                        "type": "string",
+                        "description": "New email address (optional, only if changing it)"
+                    },
+                    "first_name": {
+                        "type": "string",
+                        "description": "Updated first name (optional)"
+                    },
+                    "last_name": {
+                        "type": "string",
+                        "description": "Updated last name (optional)"
+                    },
+                },
+                "required": ["uuid"]
+            }
+        ),
+
+        # ========== COMPANY TOOLS ==========
+        Tool(
+            name="get_companies",
+            description="Retrieves companies from the CRM with pagination, sorting, and search. Returns a list of company objects with uuid, company_name, and other details.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "page": {
+                        "type": "integer",
+                        "description": "Page number for pagination (default: 1)"
+                    },
+                    "size": {
+                        "type": "integer",
+                        "description": "Number of companies per page (default: 10)"
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "description": "Field to sort by (e.g., 'company_name', 'created_at')"
+                    },
+                    "search_by": {
+                        "type": "string",
+                        "description": "Field to search in (e.g., 'company_name')"
+                    },
+                    "keyword": {
+                        "type": "string",
+                        "description": "Search keyword to filter companies"
+                    },
+                    "sort_order": {
+                        "type": "string",
+                        "description": "Sort order: 'ASC' or 'DESC' (default: 'ASC')",
+                        "enum": ["ASC", "DESC"]
                     }
-                ),
-                Tool(
-                    name="create_company",
-                    description="Creates a new company in the Insites CRM. Requires company_name at minimum. Supports comprehensive company data including contact details, social links, tax info, and custom fields.",
-                    inputSchema={
-                        "type": "object",
-                        "properties":{
-                            "company_name":{
-                                "type":"string",
-                                "description":"The name of the company (required)"
-                            },
-                            "registered_business_number":{
-                                "type":"string",
-                                "description":"Official business registration number"
-                            },
-                            "website":{
-                                "type":"string",
-                                "description":"Company website URL"
-                            },
-                            "email_1":{
-                                "type":"string",
-                                "description":"Primary email address"
-                            },
-                            "email_2":{
-                                "type":"string",
-                                "description":"Secondary email address"
-                            },
-                            "email_3":{
-                                "type":"string",
-                                "description":"Tertiary email address"
-                            },
-                            "phone_1_country_code":{
-                                "type":"string",
-                                "description":"Country code for primary phone (e.g., '1' for US)"
-                            },
-                            "phone_1_number":{
-                                "type":"string",
-                                "description":"Primary phone number"
-                            },
-                            "phone_2_country_code":{
-                                "type":"string",
-                                "description":"Country code for secondary phone"
-                            },
-                            "phone_2_number":{
-                                "type":"string",
-                                "description":"Secondary phone number"
-                            },
-                            "phone_3_country_code":{
-                                "type":"string",
-                                "description":"Country code for tertiary phone"
-                            },
-                            "phone_3_number":{
-                                "type":"string",
-                                "description":"Tertiary phone number"
-                            },
-                            "mobile_phone_country_code":{
-                                "type":"string",
-                                "description":"Country code for mobile phone"
-                            },
-                            "mobile_phone_number":{
-                                "type":"string",
-                                "description":"Mobile phone number"
-                            }
-                        },
-                        "required": ["company_name"],
-                        "additionalProperties": True
+                }
+            }
+        ),
+        Tool(
+            name="create_company",
+            description="Creates a new company in the Insites CRM. Requires company_name at minimum. Supports comprehensive company data including contact details, social links, tax info, and custom fields.",
+            inputSchema={
+                "type": "object",
+                "properties":{
+                    "company_name":{
+                        "type":"string",
+                        "description":"The name of the company (required)"
+                    },
+                    "registered_business_number":{
+                        "type":"string",
+                        "description":"Official business registration number"
+                    },
+                    "website":{
+                        "type":"string",
+                        "description":"Company website URL"
+                    },
+                    "email_1":{
+                        "type":"string",
+                        "description":"Primary email address"
+                    },
+                    "email_2":{
+                        "type":"string",
+                        "description":"Secondary email address"
+                    },
+                    "email_3":{
+                        "type":"string",
+                        "description":"Tertiary email address"
+                    },
+                    "phone_1_country_code":{
+                        "type":"string",
+                        "description":"Country code for primary phone (e.g., '1' for US)"
+                    },
+                    "phone_1_number":{
+                        "type":"string",
+                        "description":"Primary phone number"
+                    },
+                    "phone_2_country_code":{
+                        "type":"string",
+                        "description":"Country code for secondary phone"
+                    },
+                    "phone_2_number":{
+                        "type":"string",
+                        "description":"Secondary phone number"
+                    },
+                    "phone_3_country_code":{
+                        "type":"string",
+                        "description":"Country code for tertiary phone"
+                    },
+                    "phone_3_number":{
+                        "type":"string",
+                        "description":"Tertiary phone number"
+                    },
+                    "mobile_phone_country_code":{
+                        "type":"string",
+                        "description":"Country code for mobile phone"
+                    },
+                    "mobile_phone_number":{
+                        "type":"string",
+                        "description":"Mobile phone number"
                     }
-                ),
-                Tool(
-                    name="update_company",
-                    description="Updates an existing company in the Insites CRM. You must provide the company's unique 'uuid'. Only fields you provide will be updated - others remain unchanged.",
-                    inputSchema={
-                        "type": "object",
-                        "properties":{
-                            "uuid":{
-                                "type":"string",
-                                "description":"The unique UUID of the company to update (required)"
-                            },
-                            "company_name":{
-                                "type":"string",
-                                "description":"Updated company name"
-                            },
-                            "registered_business_number":{
-                                "type":"string",
-                                "description":"Updated business registration number"
-                            },
-                            "website":{
-                                "type":"string",
-                                "description":"Updated website URL"
-                            },
-                            "email_1":{
-                                "type":"string",
-                                "description":"Updated primary email"
-                            },
-                            "email_2":{
-                                "type":"string",
-                                "description":"Updated secondary email"
-                            },
-                            "email_3":{
-                                "type":"string",
-                                "description":"Updated tertiary email"
-                            },
-                            "phone_1_country_code":{
-                                "type":"string",
-                                "description":"Updated country code for primary phone"
-                            },
-                            "phone_1_number":{
-                                "type":"string",
-                                "description":"Updated primary phone number"
-                            },
-                            "phone_2_country_code":{
-                                "type":"string",
-                                "description":"Updated country code for secondary phone"
-                            },
-                            "phone_2_number":{
-                                "type":"string",
-                                "description":"Updated secondary phone number"
-                            },
-                            "phone_3_country_code":{
-                                "type":"string",
-                                "description":"Updated country code for tertiary phone"
-                            },
-                            "phone_3_number":{
-                                "type":"string",
-                                "description":"Updated tertiary phone number"
-                            },
-                            "mobile_phone_country_code":{
-                                "type":"string",
-                                "description":"Updated mobile country code"
-                            },
-                            "mobile_phone_number":{
-                                "type":"string",
-                                "description":"Updated mobile phone number"
-                            }
-                        },
-                        "required": ["uuid"],
-                        "additionalProperties": True
+                },
+                "required": ["company_name"],
+                "additionalProperties": True
+            }
+        ),
+        Tool(
+            name="update_company",
+            description="Updates an existing company in the Insites CRM. You must provide the company's unique 'uuid'. Only fields you provide will be updated - others remain unchanged.",
+            inputSchema={
+                "type": "object",
+                "properties":{
+                    "uuid":{
+                        "type":"string",
+                        "description":"The unique UUID of the company to update (required)"
+                    },
+                    "company_name":{
+                        "type":"string",
+                        "description":"Updated company name"
+                    },
+                    "registered_business_number":{
+                        "type":"string",
+                        "description":"Updated business registration number"
+                    },
+                    "website":{
+                        "type":"string",
+                        "description":"Updated website URL"
+                    },
+                    "email_1":{
+                        "type":"string",
+                        "description":"Updated primary email"
+                    },
+                    "email_2":{
+                        "type":"string",
+                        "description":"Updated secondary email"
+                    },
+                    "email_3":{
+                        "type":"string",
+                        "description":"Updated tertiary email"
+                    },
+                    "phone_1_country_code":{
+                        "type":"string",
+                        "description":"Updated country code for primary phone"
+                    },
+                    "phone_1_number":{
+                        "type":"string",
+                        "description":"Updated primary phone number"
+                    },
+                    "phone_2_country_code":{
+                        "type":"string",
+                        "description":"Updated country code for secondary phone"
+                    },
+                    "phone_2_number":{
+                        "type":"string",
+                        "description":"Updated secondary phone number"
+                    },
+                    "phone_3_country_code":{
+                        "type":"string",
+                        "description":"Updated country code for tertiary phone"
+                    },
+                    "phone_3_number":{
+                        "type":"string",
+                        "description":"Updated tertiary phone number"
+                    },
+                    "mobile_phone_country_code":{
+                        "type":"string",
+                        "description":"Updated mobile country code"
+                    },
+                    "mobile_phone_number":{
+                        "type":"string",
+                        "description":"Updated mobile phone number"
                     }
-                ),
-                
-                # # ========== OTHER TOOLS ==========
-                # Tool(
-                #     name="get_contact_relationships",
-                #     description="Get contact relationships from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_contact_addresses",
-                #     description="Get contact addresses from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_company_relationships",
-                #     description="Get company relationships from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_company_addresses",
-                #     description="Get company addresses from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_system_fields",
-                #     description="Get system fields from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_contact_system_fields",
-                #     description="Get contact custom fields from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # ),
-                # Tool(
-                #     name="get_company_system_fields",
-                #     description="Get company custom fields from the CRM system",
-                #     inputSchema={"type": "object", "properties": {}}
-                # )
-                # ========== INSTANCE MANAGEMENT TOOLS ==========
-                Tool(
-                    name="validate_subdomain",
-                    description="Validate if a name is available for a new Insites instance before creating it.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "name": {
-                                "type": "string",
-                                "description": "The name to check (e.g., 'my-new-site')"
-                            }
-                        },
-                        "required": ["name"]
+                },
+                "required": ["uuid"],
+                "additionalProperties": True
+            }
+        ),
+        
+        # # ========== OTHER TOOLS ==========
+        # Tool(
+        #     name="get_contact_relationships",
+        #     description="Get contact relationships from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_contact_addresses",
+        #     description="Get contact addresses from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_company_relationships",
+        #     description="Get company relationships from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_company_addresses",
+        #     description="Get company addresses from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_system_fields",
+        #     description="Get system fields from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_contact_system_fields",
+        #     description="Get contact custom fields from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # ),
+        # Tool(
+        #     name="get_company_system_fields",
+        #     description="Get company custom fields from the CRM system",
+        #     inputSchema={"type": "object", "properties": {}}
+        # )
+        # ========== INSTANCE MANAGEMENT TOOLS ==========
+        Tool(
+            name="validate_subdomain",
+            description="Validate if a name is available for a new Insites instance before creating it.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "The name to check (e.g., 'my-new-site')"
                     }
-                ),
-                # Tool(
-                #     name="create_instance",
-                #     description="Create a new PlatformOS instance. This tool automatically validates subdomain availability before creating the instance. Requires subdomain, pos_billing_plan_id, and pos_data_centre_id.",
-                #     inputSchema={
-                #         "type": "object",
-                #         "properties": {
-                #             "subdomain": {
-                #                 "type": "string",
-                #                 "description": "The subdomain for the new instance (required)"
-                #             },
-                #             "pos_billing_plan_id": {
-                #                 "type": "string",
-                #                 "description": "POS billing plan ID (required)"
-                #             },
-                #             "pos_data_centre_id": {
-                #                 "type": "string",
-                #                 "description": "POS data centre ID (required)"
-                #             },
-                #             "tags": {
-                #                 "type": "array",
-                #                 "items": {"type": "string"},
-                #                 "description": "List of tags for the instance (optional)"
-                #             },
-                #             "created_by": {
-                #                 "type": "string",
-                #                 "description": "Email or ID of user creating the instance (optional)"
-                #             },
-                #             "is_duplication": {
-                #                 "type": "boolean",
-                #                 "description": "Whether this is a duplication (default: false)"
-                #             },
-                #             "environment": {
-                #                 "type": "string",
-                #                 "description": "Environment: 'staging' or 'production' (default: 'production')",
-                #                 "enum": ["staging", "production"]
-                #             }
-                #         },
-                #         "required": ["subdomain", "pos_billing_plan_id", "pos_data_centre_id"]
-                #     }
-                # ),
-                Tool(
-                    name="create_instance",
-                    description="""Complete Insites instance creation workflow (RECOMMENDED). 
+                },
+                "required": ["name"]
+            }
+        ),
+        # Tool(
+        #     name="create_instance",
+        #     description="Create a new PlatformOS instance. This tool automatically validates subdomain availability before creating the instance. Requires subdomain, pos_billing_plan_id, and pos_data_centre_id.",
+        #     inputSchema={
+        #         "type": "object",
+        #         "properties": {
+        #             "subdomain": {
+        #                 "type": "string",
+        #                 "description": "The subdomain for the new instance (required)"
+        #             },
+        #             "pos_billing_plan_id": {
+        #                 "type": "string",
+        #                 "description": "POS billing plan ID (required)"
+        #             },
+        #             "pos_data_centre_id": {
+        #                 "type": "string",
+        #                 "description": "POS data centre ID (required)"
+        #             },
+        #             "tags": {
+        #                 "type": "array",
+        #                 "items": {"type": "string"},
+        #                 "description": "List of tags for the instance (optional)"
+        #             },
+        #             "created_by": {
+        #                 "type": "string",
+        #                 "description": "Email or ID of user creating the instance (optional)"
+        #             },
+        #             "is_duplication": {
+        #                 "type": "boolean",
+        #                 "description": "Whether this is a duplication (default: false)"
+        #             },
+        #             "environment": {
+        #                 "type": "string",
+        #                 "description": "Environment: 'staging' or 'production' (default: 'production')",
+        #                 "enum": ["staging", "production"]
+        #             }
+        #         },
+        #         "required": ["subdomain", "pos_billing_plan_id", "pos_data_centre_id"]
+        #     }
+        # ),
+        Tool(
+            name="create_instance",
+            description="""Complete Insites instance creation workflow (RECOMMENDED). 
                     
                     IMPORTANT: When presenting results to the user, always use the phrase "Insites instance" in your response.
                     
@@ -569,33 +644,71 @@ async def mcp_list_tools(request: ToolsRequest) -> ToolsListResponse:
                     When presenting results, format your response like:
                     "Perfect! I've successfully created your new Insites instance '[name]'. Here are the details:"
                     Then show the instance details clearly.""",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "name": {
-                                "type": "string", 
-                                "description": "Instance name/subdomain (required)"
-                            },
-                            "environment": {
-                                "type": "string",
-                                "description": "Environment: 'staging' or 'production' (default: 'staging')",
-                                "enum": ["staging", "production"]
-                            }
-                        },
-                        "required": ["name"]
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string", 
+                        "description": "Instance name/subdomain (required)"
+                    },
+                    "environment": {
+                        "type": "string",
+                        "description": "Environment: 'staging' or 'production' (default: 'staging')",
+                        "enum": ["staging", "production"]
                     }
-                )
-            ]
+                },
+                "required": ["name"]
+            }
         )
-    except Exception as e:
-        logger.error(f"Error listing tools: {e}")
-        import traceback
-        error_traceback = traceback.format_exc()
-        logger.error(f"Full traceback: {error_traceback}")
-        raise HTTPException(status_code=400, detail=f"Error listing tools: {str(e)}\n\nTraceback:\n{error_traceback}")
-
-@app.post("/mcp/tools/call")
-async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] = None, instance_api_key: Optional[str] = None) -> CallToolResponse:
+    ]
+)
+
+# Serialized once as well; tools/list sends these bytes as they are
+_TOOLS_LIST_JSON = _TOOLS_LIST_RESPONSE.model_dump_json().encode()
+
+
+def _error_response_json(text: str) -> bytes:
+    """Serialized CallToolResponse for a fixed error message."""
+    return CallToolResponse(content=[{"type": "text", "text": text}], isError=True).model_dump_json().encode()
+
+# tools/call errors whose text never varies, serialized once
+_CRM_CREDENTIALS_MISSING_JSON = _error_response_json(
+    "instance_url and instance_api_key query parameters are required for CRM tools"
+)
+_GCP_PROJECT_MISSING_JSON = _error_response_json(
+    "GCP_PROJECT_ID environment variable is not set. This is required for Secret Manager access."
+)
+_SUBDOMAIN_NAME_MISSING_JSON = _error_response_json(
+    "Missing required parameter: 'name' or 'subdomain' is required for validate_subdomain"
+)
+_INSTANCE_NAME_MISSING_JSON = _error_response_json(
+    "Missing required parameter: 'name' is required for create_instance"
+)
+
+# Responses are declared as return annotations, not response_model=None:
+# FastAPI passes the returned model through without re-validating it and
+# dumps it to JSON in Pydantic's Rust core, about 3x faster than the
+# jsonable_encoder + json.dumps path an unannotated endpoint takes.
+
+# tools/list is the exception: it returns prebuilt bytes, and response_model
+# only documents their shape. tools/call also returns prebuilt bytes for its
+# fixed errors, so it declares response_model explicitly too; returned
+# models still take the fast path above.
+@app.post("/mcp/tools/list", response_model=ToolsListResponse)
+async def mcp_list_tools(request: ToolsRequest) -> Response:
+    """
+    MCP standard endpoint: List all available tools.
+    This follows the MCP protocol specification.
+    """
+    # The list is the same for every caller; the credentials are only used
+    # by tools/call, so just require that they were sent
+    if not request.instance_url or not request.instance_api_key:
+        raise HTTPException(status_code=400, detail="instance_url and instance_api_key are required")
+
+    return Response(content=_TOOLS_LIST_JSON, media_type="application/json")
+
+@app.post("/mcp/tools/call", response_model=CallToolResponse)
+async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] = None, instance_api_key: Optional[str] = None) -> Union[CallToolResponse, Response]:
     """
     MCP standard endpoint: Execute a tool with given arguments.
     Note: instance_url and instance_api_key are required for CRM tools, optional for instance management tools
@@ -605,92 +718,44 @@ async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] =
         tool_name = request.name
         args = request.arguments or {}
         
-        logger.info(f"📥 Tool call received: name='{tool_name}', args keys={list(args.keys())}, instance_url={bool(instance_url)}, instance_api_key={bool(instance_api_key)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "📥 Tool call received: name='%s', args keys=%s, instance_url=%s, instance_api_key=%s",
+                tool_name, list(args), bool(instance_url), bool(instance_api_key)
+            )
         # CRM Tools
-        if tool_name in ["get_contacts", "create_contact", "update_contact", 
-                         "get_companies", "create_company", "update_company"]:
+        if tool_name in _CRM_DISPATCH:
             if not instance_url or not instance_api_key:
-                return CallToolResponse(
-                    content=[{
-                        "type": "text",
-                        "text": "instance_url and instance_api_key query parameters are required for CRM tools"
-                    }],
-                    isError=True
-                )
-            crm = CRMTools(instance_url, instance_api_key)
+                return Response(content=_CRM_CREDENTIALS_MISSING_JSON, media_type="application/json")
+            crm = get_crm_tools(instance_url, instance_api_key)
             # ... existing CRM tool handlers ...
         
-            # Execute the appropriate method
-            if tool_name == "get_contacts":
-                result = crm.get_contacts(args)
-            # elif tool_name == "get_contact_relationships":
-            #     result = crm.get_contact_relationships()
-            # elif tool_name == "get_contact_addresses":
-            #     result = crm.get_contact_addresses()
-            elif tool_name == "get_companies":
-                result = crm.get_companies(args)
-            # elif tool_name == "get_company_relationships":
-            #     result = crm.get_company_relationships()
-            # elif tool_name == "get_company_addresses":
-            #     result = crm.get_company_addresses()
-            # elif tool_name == "get_system_fields":
-            #     result = crm.get_system_fields()
-            # elif tool_name == "get_contact_system_fields":
-            #     result = crm.get_contact_system_fields()
-            # elif tool_name == "get_company_system_fields":
-            #     result = crm.get_company_system_fields()
-            # elif tool_name == "save_contact":
-            #     result = crm.save_contact(args.get("contact_data", {}))
-            elif tool_name == "create_contact":
-                result = crm.save_contact(args)  # Create is same as save without uuid
-            elif tool_name == "update_contact":
-                result = crm.save_contact(args)  # Update is save with uuid
-            elif tool_name == "create_company":
-                result = crm.create_company(args) 
-            elif tool_name == "update_company":
-                result = crm.update_company(args) 
-            else:
-                return CallToolResponse(
-                    content=[{
-                        "type": "text",
-                        "text": f"Unknown tool: {tool_name}"
-                    }],
-                    isError=True
-                )
+            # CRMTools makes blocking HTTP calls; run them on the thread pool
+            # so the event loop keeps serving other requests meanwhile
+            result = await asyncio.to_thread(_CRM_DISPATCH[tool_name], crm, args)
         # Instance Management Tools
-        elif tool_name in ["validate_subdomain", "create_instance"]:
-            logger.info(f"🔧 Processing instance tool: {tool_name}")
+        elif tool_name in _INSTANCE_TOOLS:
+            logger.info("🔧 Processing instance tool: %s", tool_name)
             
             # Ensure GCP_PROJECT_ID is set (required for Secret Manager)
             if not GCP_PROJECT_ID:
-                return CallToolResponse(
-                    content=[{
-                        "type": "text",
-                        "text": "GCP_PROJECT_ID environment variable is not set. This is required for Secret Manager access."
-                    }],
-                    isError=True
-                )
+                return Response(content=_GCP_PROJECT_MISSING_JSON, media_type="application/json")
             
             # Get Console credentials
-            console_email = args.pop("console_email", None) or os.getenv("CONSOLE_EMAIL", "")
+            console_email = args.pop("console_email", None) or CONSOLE_EMAIL
             
             if not console_email and tool_name == "create_instance":
                 logger.warning("⚠️  CONSOLE_EMAIL not provided, some operations may fail")
             
             # Initialize instance tools - it will fetch credentials from Secret Manager internally
             try:
-                instance_tools = InstanceTools(
-                    console_email=console_email
-                )
-                logger.info("✅ InstanceTools initialized successfully")
+                instance_tools = get_instance_tools(console_email)
             except Exception as init_error:
-                logger.error(f"❌ Failed to initialize InstanceTools: {init_error}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("❌ Failed to initialize InstanceTools for '%s'", tool_name, extra={"tool_name": tool_name})
                 return CallToolResponse(
                     content=[{
                         "type": "text",
-                        "text": f"Failed to initialize InstanceTools: {str(init_error)}\n\nThis usually means:\n1. GCP_PROJECT_ID is not set\n2. Secret Manager permissions are missing\n3. Required secrets don't exist in Secret Manager\n\nTraceback:\n{traceback.format_exc()}"
+                        "text": f"Failed to initialize InstanceTools: {str(init_error)}\n\nThis usually means:\n1. GCP_PROJECT_ID is not set\n2. Secret Manager permissions are missing\n3. Required secrets don't exist in Secret Manager"
                     }],
                     isError=True
                 )
@@ -702,56 +767,46 @@ async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] =
                     # Handle both "name" and "subdomain" parameter names for compatibility
                     subdomain_input = args.get("name") or args.get("subdomain", "")
                     if not subdomain_input:
-                        return CallToolResponse(
-                            content=[{
-                                "type": "text",
-                                "text": "Missing required parameter: 'name' or 'subdomain' is required for validate_subdomain"
-                            }],
-                            isError=True
-                        )
-                    logger.info(f"🔍 Validating subdomain: {subdomain_input}")
-                    result = instance_tools.validate_subdomain(name=subdomain_input)
+                        return Response(content=_SUBDOMAIN_NAME_MISSING_JSON, media_type="application/json")
+                    logger.info("🔍 Validating subdomain: %s", subdomain_input)
+                    result = await validate_subdomain_cached(instance_tools, subdomain_input)
                 
-                elif tool_name == "create_instance":
+                else:  # create_instance
                     # Validate required parameters
                     name = args.get("name")
                     if not name:
-                        return CallToolResponse(
-                            content=[{
-                                "type": "text",
-                                "text": "Missing required parameter: 'name' is required for create_instance"
-                            }],
-                            isError=True
-                        )
+                        return Response(content=_INSTANCE_NAME_MISSING_JSON, media_type="application/json")
                     
                     # Provide default for environment if not specified
                     environment = args.get("environment", "production")
                     
-                    logger.info(f"🚀 Creating instance: name={name}, environment={environment}")
-                    result = instance_tools.create_instance_complete_workflow(
+                    logger.info("🚀 Creating instance: name=%s, environment=%s", name, environment)
+                    result = await asyncio.to_thread(
+                        instance_tools.create_instance_complete_workflow,
                         name=name,
                         environment=environment
                     )
-                else:
-                    return CallToolResponse(
-                        content=[{"type": "text", "text": f"Unknown tool: {tool_name}"}],
-                        isError=True
-                    )
             except Exception as tool_error:
-                logger.error(f"❌ Error executing instance tool '{tool_name}': {tool_error}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
+                logger.exception("❌ Error executing instance tool '%s'", tool_name, extra={"tool_name": tool_name})
                 return CallToolResponse(
                     content=[{
                         "type": "text",
-                        "text": f"Failed to execute tool '{tool_name}': {str(tool_error)}\n\nTraceback:\n{traceback.format_exc()}"
+                        "text": f"Failed to execute tool '{tool_name}': {str(tool_error)}"
                     }],
                     isError=True
                 )
+        else:
+            return CallToolResponse(
+                content=[{
+                    "type": "text",
+                    "text": f"Unknown tool: {tool_name}"
+                }],
+                isError=True
+            )
         
         # Check if result exists
         if result is None:
-            logger.error(f"❌ Tool '{tool_name}' returned None result")
+            logger.error("❌ Tool '%s' returned None result", tool_name)
             return CallToolResponse(
                 content=[{
                     "type": "text",
@@ -782,33 +837,33 @@ async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] =
             return CallToolResponse(
                 content=[{
                     "type": "text",
-                    "text": formatted_response
+                    "text": orjson.dumps(formatted_response).decode()
                 }],
                 isError=False
             )
         # Check if result indicates an error
         is_error = not result.get("success", True)
         
-        logger.info(f"✅ Tool '{tool_name}' executed. Success: {not is_error}")
+        logger.info("✅ Tool '%s' executed. Success: %s", tool_name, not is_error)
         if is_error:
-            logger.warning(f"⚠️  Tool '{tool_name}' returned error: {result.get('error', 'Unknown error')}")
+            logger.warning("⚠️  Tool '%s' returned error: %s", tool_name, result.get('error', 'Unknown error'))
         
+        # Compact: the text goes to an MCP client / LLM, not a human, and
+        # indentation roughly doubles its size
         return CallToolResponse(
             content=[{
                 "type": "text",
-                "text": json.dumps(result, indent=2)
+                "text": orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS).decode()
             }],
             isError=is_error
         )
         
     except Exception as e:
-        logger.error(f"Error executing tool '{request.name}': {e}")
-        import traceback
-        error_detail = f"Error executing tool '{request.name}': {str(e)}\n{traceback.format_exc()}"
+        logger.exception("Error executing tool '%s'", request.name, extra={"tool_name": request.name})
         return CallToolResponse(
             content=[{
                 "type": "text",
-                "text": error_detail
+                "text": f"Error executing tool '{request.name}': {str(e)}"
             }],
             isError=True
         )
@@ -817,15 +872,18 @@ async def mcp_call_tool(request: CallToolRequest, instance_url: Optional[str] =
 # LEGACY ENDPOINTS (for backward compatibility)
 # ============================================================================
 
+# The health payload never changes, so it is serialized once
+_HEALTH_JSON = orjson.dumps({
+    "status": "healthy",
+    "service": "Insites MCP Sever",
+    "version": "0.1.2",
+    "message": "Server is running and ready",
+})
+
 @app.get("/")
-async def health_check():
+async def health_check() -> Response:
     """Health check endpoint for the API service."""
-    return {
-        "status": "healthy",
-        "service": "Insites MCP Sever",
-        "version": "0.1.2",
-        "message": "Server is running and ready",
-    }
+    return Response(content=_HEALTH_JSON, media_type="application/json")
 
 # Legacy /tools endpoint for backward compatibility
 @app.post("/tools")
@@ -837,4 +895,26 @@ async def list_tools(request: ToolsRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+
+    # uvloop and httptools have no Windows builds and may be missing on dev
+    # machines; fall back to uvicorn's pure-Python loop and parser there
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop=loop,
+        http=http,
+        lifespan="on",
+        # Only raise this on instances with more than one vCPU
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1))
+    )
\ No newline at end of file
@@ -4,76 +4,270 @@
 
 import asyncio
 import os
-import uuid
 import json
-import uvicorn
-# import hashlib
+import hashlib
+import time
+import logging
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from langchain_core.messages import HumanMessage
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
 from langchain.agents import create_agent
-from langchain_mcp_adapters.tools import load_mcp_tools
-from langchain_google_genai import ChatGoogleGenerativeAI # Official LangChain integration for Google Generative AI
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from collections import defaultdict
-from typing import Dict, Any
-# from cache_manager import CacheManager
+from typing import Dict, Any, List, Optional, Tuple
+from cache_manager import CacheManager
+from mcp_session_pool import McpSessionPool
+from stream_sessions import StreamSessionStore
+from utils.json_logging import configure_logging
+from utils.responses import ORJSONResponse
 
 # --- Load environment variables from .env file ---
 load_dotenv()
 
+# LOG_FORMAT=json emits one JSON object per line for Cloud Logging
+configure_logging(json_format=os.getenv("LOG_FORMAT", "").lower() == "json")
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 # --- IMPORTANT: These environment variables MUST be set in your Cloud Run service or .env file ---
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCP_REGION = os.getenv("GCP_REGION")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
-# REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-# CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
-# ENABLE_CACHING = os.getenv("ENABLE_CACHING", "true").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Agent answers reflect live CRM data; keep them briefly
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+ENABLE_CACHING = os.getenv("ENABLE_CACHING", "true").lower() == "true"
+MCP_SESSION_IDLE_TTL_SECONDS = int(os.getenv("MCP_SESSION_IDLE_TTL_SECONDS", "300"))
+MCP_MAX_SESSIONS = int(os.getenv("MCP_MAX_SESSIONS", "32"))
+MCP_TOOLS_TTL_SECONDS = int(os.getenv("MCP_TOOLS_TTL_SECONDS", "300"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "10000"))
+STREAM_SESSION_IDLE_TTL_SECONDS = int(os.getenv("STREAM_SESSION_IDLE_TTL_SECONDS", "600"))
+STREAM_QUEUE_MAXSIZE = int(os.getenv("STREAM_QUEUE_MAXSIZE", "256"))
+STREAM_ABANDON_GRACE_SECONDS = int(os.getenv("STREAM_ABANDON_GRACE_SECONDS", "30"))
+SSE_KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "64"))
+AGENT_CACHE_TTL_SECONDS = int(os.getenv("AGENT_CACHE_TTL_SECONDS", "600"))
+# Threads for blocking work offloaded with asyncio.to_thread
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", str(min(64, (os.cpu_count() or 1) * 8))))
 
 # Handle credentials - use local vertex-credentials.json file
 CREDENTIALS_PATH = os.path.join(os.path.dirname(__file__), "vertex-credentials.json")
-if os.path.exists(CREDENTIALS_PATH):
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
-    print(f"Using local credentials from: {CREDENTIALS_PATH}")
-else:
-    # Fallback to environment variable if local file doesn't exist
-    env_credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    if env_credentials:
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = env_credentials
-        print(f"Using credentials from environment: {env_credentials}")
+
+
+def resolve_credentials():
+    """Point GOOGLE_APPLICATION_CREDENTIALS at the credentials to use.
+
+    Checks the filesystem, so lifespan runs it in a worker thread.
+    """
+    if os.path.exists(CREDENTIALS_PATH):
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
+        print(f"Using local credentials from: {CREDENTIALS_PATH}")
     else:
-        # In Cloud Run, use the default service account credentials
-        print("Using default service account credentials from Cloud Run")
+        # Fallback to environment variable if local file doesn't exist
+        env_credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if env_credentials:
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = env_credentials
+            print(f"Using credentials from environment: {env_credentials}")
+        else:
+            # In Cloud Run, use the default service account credentials
+            print("Using default service account credentials from Cloud Run")
 
 if not all([GCP_PROJECT_ID, GCP_REGION]):
     raise ValueError("GCP_PROJECT_ID and GCP_REGION must be set.")
 
 # --- Asynchronous Message Queues for Streaming ---
-# This dictionary holds the message queues for each session_id
-message_queues: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+# Per-session stream buffers live in app.state.stream_sessions (a bounded
+# StreamSessionStore); /sse opens a session and /messages publishes to it.
+
+# --- Response cache helpers ---
+# Tools that only read CRM data. A run that calls anything else (save_contact,
+# create_contact_address, ...) changed state, so its answer isn't cached.
+READ_ONLY_TOOL_PREFIXES = ("get_", "list_", "fetch_")
+
+
+def is_read_only_run(messages) -> bool:
+    """True if every tool the agent called in this run only reads CRM data."""
+    for message in messages:
+        for tool_call in getattr(message, "tool_calls", None) or ():
+            if not tool_call["name"].startswith(READ_ONLY_TOOL_PREFIXES):
+                return False
+    return True
+
+
+def api_key_context(instance_api_key: str, endpoint: str) -> Dict[str, str]:
+    """Cache context separating API keys (without storing them) and endpoints,
+    since /messages and /query prompt the agent differently."""
+    return {
+        # The full digest: a short prefix would let another key for the same
+        # instance collide with this one and be served its cached answers
+        "api_key_hash": hashlib.sha256(instance_api_key.encode()).hexdigest(),
+        "endpoint": endpoint
+    }
+
+# --- Agent prompt ---
+# Sent as the model's system instruction rather than pasted into the user
+# message. Together with the tool schemas it forms a prefix that is identical
+# on every request, which Gemini's implicit context caching bills at the
+# cached-token rate once it has been seen.
+AGENT_SYSTEM_PROMPT = """You are an expert CRM assistant. When presenting data, always provide comprehensive, well-structured responses similar to professional AI assistants.
+
+RESPONSE FORMATTING RULES:
+1. Use clear headers and bullet points for readability
+2. Include ALL relevant details from the data
+3. Present information in logical groupings
+4. Always include UUIDs for future reference
+5. Highlight important relationships (companies, assignments)
+6. Use markdown-style formatting for structure
+
+For contact data, include:
+- Full contact details (name, email, phone, company)
+- System information (UUIDs, creation dates)
+- Relationships and associations
+- Any special notes or alerts
+
+TOOL USE:
+When a request needs several independent lookups (e.g. contacts and companies), call those tools together in the same step rather than one after another.
+Large results come back as a "handle" (crm://...) with a row_count and a schema_preview of the first rows instead of the full data. Answer from the preview when it is enough; otherwise call fetch_handle with the handle and a jsonpath (e.g. "$.results[0:20]") to read only the rows or fields you need.
+
+Be thorough and professional - users expect detailed, actionable information."""
+
+
+def content_text(content) -> str:
+    """Text of a model message or chunk, whose content may be a list of parts."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+        if isinstance(part, (str, dict))
+    )
+
+
+def cached_input_tokens(messages) -> int:
+    """Input tokens the model served from its prompt cache during an agent run."""
+    total = 0
+    for message in messages:
+        usage = getattr(message, "usage_metadata", None) or {}
+        total += (usage.get("input_token_details") or {}).get("cache_read", 0)
+    return total
+
+# --- Compiled agents ---
+# create_agent builds and compiles a LangGraph state graph. Pooled tools are
+# bound to one MCP session and a tools refresh yields a new list, so compiled
+# agents are cached per tool list object (held alongside, so its id can't be
+# reused) and system prompt. Entries expire after AGENT_CACHE_TTL_SECONDS so
+# agents for sessions the pool has closed don't keep their tools alive.
+_agents: "OrderedDict[Tuple[int, Optional[str]], Tuple[List[Any], Any, float]]" = OrderedDict()
+
+
+def get_agent(tools: List[Any], system_prompt: Optional[str] = None):
+    """Return the compiled agent for a pooled tool list, building it on first use.
+
+    Run it with ainvoke/astream only: on the async path the agent's
+    tool node gathers every tool call the model makes in one step, and the
+    CRM server runs each on its own thread, so a step costs its slowest call.
+    """
+    key = (id(tools), system_prompt)
+    now = time.monotonic()
+    cached = _agents.get(key)
+    if cached is not None and cached[0] is tools and now - cached[2] < AGENT_CACHE_TTL_SECONDS:
+        _agents.move_to_end(key)
+        return cached[1]
+    agent = create_agent(app.state.llm, tools, system_prompt=system_prompt)
+    _agents[key] = (tools, agent, now)
+    _agents.move_to_end(key)
+    # Drop expired entries (oldest first) and anything over the size bound
+    while _agents:
+        oldest = next(iter(_agents.values()))
+        if len(_agents) <= AGENT_CACHE_SIZE and now - oldest[2] < AGENT_CACHE_TTL_SECONDS:
+            break
+        _agents.popitem(last=False)
+    return agent
+
+
+def prewarm_agent(llm):
+    """Build a throwaway agent around a stub tool.
+
+    Binding tools and compiling the agent graph import and initialize code
+    lazily on first use; doing it here keeps that off the first request.
+    """
+    @tool
+    def fetch_handle(handle: str, jsonpath: Optional[str] = None) -> str:
+        """Stub with the shape of a CRM server tool."""
+        return ""
+
+    try:
+        llm.bind_tools([fetch_handle])
+        create_agent(llm, [fetch_handle], system_prompt=AGENT_SYSTEM_PROMPT)
+    except Exception:
+        # Only an optimization; real requests will surface real problems
+        logger.warning("Agent pre-warm failed", exc_info=True)
+
+
+async def warm_up_llm(llm):
+    """Make one small LLM call so auth and the connection are ready for real traffic."""
+    try:
+        await llm.ainvoke("Hello")
+        print("✅ LLM connection test successful")
+    except Exception:
+        # Don't fail startup for this, but log it
+        logger.warning("LLM connection test failed", exc_info=True, extra={"model": GEMINI_MODEL_NAME})
+
+
+async def wait_for_llm_warmup():
+    """Let early requests reuse the warm-up's connection instead of racing it."""
+    warmup = getattr(app.state, "llm_warmup", None)
+    if warmup is not None and not warmup.done():
+        await asyncio.shield(warmup)
 
 # --- FastAPI App ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting MCP CRM Server with UI...")
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="blocking")
+    )
+    await asyncio.to_thread(resolve_credentials)
 
-    # # Initialize cache manager
-    # app.state.cache_manager = CacheManager(REDIS_URL, CACHE_TTL_SECONDS)
-    # if ENABLE_CACHING:
-    #     await app.state.cache_manager.initialize()
-    # else:
-    #     print("⚠️ Caching disabled")
-    #     app.state.cache_manager.is_enabled = False
+    # Initialize cache manager
+    app.state.cache_manager = CacheManager({"url": REDIS_URL}, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+    if ENABLE_CACHING:
+        await app.state.cache_manager.initialize()
+    else:
+        print("⚠️ Caching disabled")
+        app.state.cache_manager.is_enabled = False
+
+    # Long-lived CRM server sessions, reused across requests
+    app.state.mcp_pool = McpSessionPool(
+        idle_ttl_seconds=MCP_SESSION_IDLE_TTL_SECONDS,
+        max_sessions=MCP_MAX_SESSIONS,
+        tools_ttl_seconds=MCP_TOOLS_TTL_SECONDS
+    )
+    await app.state.mcp_pool.initialize()
+
+    # Bounded per-session buffers for SSE streaming
+    app.state.stream_sessions = StreamSessionStore(
+        max_sessions=STREAM_MAX_SESSIONS,
+        idle_ttl_seconds=STREAM_SESSION_IDLE_TTL_SECONDS,
+        max_queue_size=STREAM_QUEUE_MAXSIZE,
+        abandon_grace_seconds=STREAM_ABANDON_GRACE_SECONDS
+    )
+    await app.state.stream_sessions.initialize()
     
     try:
         print("🔧 Initializing LLM and MCP tools...")
-        # Initialize the LLM (Claude on Vertex AI)
+        # Initialize the LLM (Gemini through the official LangChain
+        # integration), imported here to keep module import light
+        from langchain_google_genai import ChatGoogleGenerativeAI
         llm = ChatGoogleGenerativeAI(
             model=GEMINI_MODEL_NAME,
             temperature=0,
@@ -83,32 +277,24 @@ async def lifespan(app: FastAPI):
 
         # Store the LLM for later use
         app.state.llm = llm
+        print("✅ LLM initialized successfully.")
+        await asyncio.to_thread(prewarm_agent, llm)
         
-        # Create a simple agent without tools initially
-        app.state.agent = create_agent(llm, [])
-        print("✅ LLM agent initialized successfully.")
-        
-        # Test the LLM connection
-        try:
-            test_message = await llm.ainvoke("Hello")
-            print("✅ LLM connection test successful")
-        except Exception as test_error:
-            print(f"⚠️ LLM connection test failed: {test_error}")
-            # Don't fail startup for this, but log it
-            
-    except Exception as e:
-        print(f"❌ Error initializing LLM: {e}")
-        import traceback
-        traceback.print_exc()
+        # Test the LLM connection in the background so startup doesn't wait
+        # for a Vertex round trip before accepting requests
+        app.state.llm_warmup = asyncio.create_task(warm_up_llm(llm))
+
+    except Exception:
         # Log the error but don't fail startup completely
-        print(f"⚠️ Continuing with startup despite LLM initialization error")
+        logger.exception("❌ Error initializing LLM; continuing with startup")
         app.state.llm = None
-        app.state.agent = None
     
     yield
     
     # Shutdown (if needed)
     print("🛑 Shutting down MCP CRM Server...")
+    await app.state.stream_sessions.close()
+    await app.state.mcp_pool.close()
     try:
         # Clean up any remaining tasks
         for task in asyncio.all_tasks():
@@ -122,42 +308,55 @@ app = FastAPI(
     title="MCP CRM API with UI",
     description="API for CRM operations using MCP protocol and LangChain with web interface",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # The endpoints here return plain dicts (cache stats, /query answers)
+    default_response_class=ORJSONResponse
 )
 
+# Compresses the UI page and JSON answers; SSE responses opt out (see SSE_HEADERS)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Global exception handler for unhandled async errors
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    print(f"DEBUG: Global exception handler caught: {exc}")
-    import traceback
-    traceback.print_exc()
-    return {
-        "success": False,
-        "error": "Internal server error",
-        "detail": str(exc),
-        "timestamp": "2025-08-11T02:30:00Z"
-    }
+    logger.error(
+        "Unhandled exception", exc_info=exc, extra={"path": request.url.path}
+    )
+    # Exception handlers must return a Response, not a dict
+    return ORJSONResponse(
+        status_code=500,
+        content={
+            "success": False,
+            "error": "Internal server error",
+            "detail": str(exc),
+            "timestamp": "2025-08-11T02:30:00Z"
+        }
+    )
 
 # --- Mount static files ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # --- Health Check Endpoint ---
+# Both health payloads are constant; serialize them once rather than per probe
+_HEALTH_JSON = orjson.dumps({
+    "status": "healthy",
+    "service": "MCP CRM API with UI",
+    "version": "1.0.0",
+    "timestamp": "2025-08-11T02:30:00Z",
+    "message": "Server is running and ready",
+    "ui_url": "/ui"
+})
+_HEALTH_SIMPLE_JSON = orjson.dumps({"status": "ok"})
+
 @app.get("/")
-async def health_check():
+async def health_check() -> Response:
     """Health check endpoint for the API service."""
-    return {
-        "status": "healthy",
-        "service": "MCP CRM API with UI",
-        "version": "1.0.0",
-        "timestamp": "2025-08-11T02:30:00Z",
-        "message": "Server is running and ready",
-        "ui_url": "/ui"
-    }
+    return Response(content=_HEALTH_JSON, media_type="application/json")
 
 @app.get("/health")
-async def health_check_simple():
+async def health_check_simple() -> Response:
     """Simple health check that responds immediately."""
-    return {"status": "ok"}
+    return Response(content=_HEALTH_SIMPLE_JSON, media_type="application/json")
 
 # --- Pure MCP Protocol Endpoint ---
 @app.get("/mcp/tools/list", response_class=Response)
@@ -302,71 +501,87 @@ async def serve_ui():
         raise HTTPException(status_code=500, detail=f"Error serving UI: {str(e)}")
 
 # --- API Documentation ---
-@app.get("/docs")
-async def api_docs():
-    """API documentation and usage examples."""
-    return {
-        "endpoints": {
-            "GET /": "Health check",
-            "GET /ui": "Web UI for CRM assistant",
-            "GET /docs": "This API documentation",
-            "GET /tools": "List all available MCP tools (REST wrapper)",
-            "GET /mcp/tools/list": "Pure MCP protocol tools/list endpoint",
-            "POST /messages": "Send a prompt to the CRM agent (with SSE streaming)",
-            "POST /query": "Direct query endpoint (synchronous response)",
-            "GET /sse": "Server-Sent Events stream for real-time responses"
+# Served at /usage: FastAPI's Swagger UI is registered at /docs first, so a
+# /docs route here would never be reached. Static, so serialized once at import
+_API_DOCS_JSON = orjson.dumps({
+    "endpoints": {
+        "GET /": "Health check",
+        "GET /ui": "Web UI for CRM assistant",
+        "GET /docs": "Interactive OpenAPI (Swagger UI) documentation",
+        "GET /usage": "This endpoint list and usage examples",
+        "GET /tools": "List all available MCP tools (REST wrapper)",
+        "GET /mcp/tools/list": "Pure MCP protocol tools/list endpoint",
+        "POST /messages": "Send a prompt to the CRM agent (with SSE streaming)",
+        "POST /query": "Direct query endpoint (synchronous response)",
+        "GET /cache/stats": "Response cache statistics",
+        "GET /metrics": "Stream buffer depths and MCP session pool gauges",
+        "POST /cache/clear": "Clear cached responses (optional ?pattern=)",
+        "GET /sse": "Server-Sent Events stream for real-time responses"
+    },
+    "usage": {
+        "GET /ui": {
+            "description": "Access the web interface for the CRM assistant",
+            "note": "Open this URL in your browser to use the UI"
         },
-        "usage": {
-            "GET /ui": {
-                "description": "Access the web interface for the CRM assistant",
-                "note": "Open this URL in your browser to use the UI"
-            },
-            "GET /tools": {
-                "description": "List all available MCP tools with descriptions and schemas (REST API)",
-                "note": "User-friendly REST wrapper around MCP tools/list protocol"
-            },
-            "GET /mcp/tools/list": {
-                "description": "Pure MCP protocol endpoint implementing tools/list JSON-RPC method",
-                "note": "For MCP clients and protocol-level integration",
-                "example": {
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "tools/list",
-                    "params": {"cursor": "optional-cursor-value"}
-                }
-            },
-            "POST /messages": {
-                "url": "/messages?session_id={session_id}&instance_url={instance_url}&instance_api_key={instance_api_key}",
-                "body": {"prompt": "Your CRM query here"},
-                "example": "Get me all contacts",
-                "note": "Use with SSE endpoint for streaming responses"
-            },
-            "POST /query": {
-                "url": "/query?instance_url={instance_url}&instance_api_key={instance_api_key}",
-                "body": {"prompt": "Your CRM query here"},
-                "example": "Get me all contacts",
-                "note": "Direct response, no streaming required"
-            },
-            "GET /sse": {
-                "url": "/sse?session_id={session_id}&instance_url={instance_url}&instance_api_key={instance_api_key}",
-                "description": "Establish SSE connection for streaming responses"
+        "GET /tools": {
+            "url": "/tools?instance_url={instance_url}&instance_api_key={instance_api_key}&cache=true&cache_ttl_seconds=300",
+            "description": "List all available MCP tools with descriptions and schemas (REST API)",
+            "note": "Tool list is cached per instance; cache=false forces a refresh, cache_ttl_seconds sets the maximum age"
+        },
+        "GET /mcp/tools/list": {
+            "description": "Pure MCP protocol endpoint implementing tools/list JSON-RPC method",
+            "note": "For MCP clients and protocol-level integration",
+            "example": {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "tools/list",
+                "params": {"cursor": "optional-cursor-value"}
             }
         },
-        "mcp_protocol": {
-            "description": "This server implements both REST API and MCP protocol endpoints",
-            "endpoints": {
-                "/tools": "REST wrapper for easy web integration",
-                "/mcp/tools/list": "Native MCP protocol implementation"
-            },
-            "protocol": "JSON-RPC 2.0 with MCP tools/list method",
-            "note": "Both endpoints discover the same tools but in different formats"
+        "POST /messages": {
+            "url": "/messages?session_id={session_id}&instance_url={instance_url}&instance_api_key={instance_api_key}&cache=true",
+            "body": {"prompt": "Your CRM query here"},
+            "example": "Get me all contacts",
+            "note": "Use with SSE endpoint for streaming responses; cache=false skips a cached response"
         },
-        "parameters": {
-            "session_id": "Unique identifier for the conversation session",
-            "instance_url": "Your CRM instance URL",
-            "instance_api_key": "Your CRM instance API key"
+        "POST /query": {
+            "url": "/query?instance_url={instance_url}&instance_api_key={instance_api_key}&cache=true",
+            "body": {"prompt": "Your CRM query here"},
+            "example": "Get me all contacts",
+            "note": "Direct response, no streaming required; cache=false skips a cached response"
+        },
+        "GET /sse": {
+            "url": "/sse?session_id={session_id}&instance_url={instance_url}&instance_api_key={instance_api_key}",
+            "description": "Establish SSE connection for streaming responses",
+            "resume": "Send Last-Event-ID (or last_event_id=) with the last received id to replay missed events",
+            "events": {
+                "token": "Partial model output while the agent runs",
+                "tool": "A tool the agent is calling",
+                "message": "The complete response (replaces streamed tokens), then END_STREAM"
+            }
         }
+    },
+    "mcp_protocol": {
+        "description": "This server implements both REST API and MCP protocol endpoints",
+        "endpoints": {
+            "/tools": "REST wrapper for easy web integration",
+            "/mcp/tools/list": "Native MCP protocol implementation"
+        },
+        "protocol": "JSON-RPC 2.0 with MCP tools/list method",
+        "note": "Both endpoints discover the same tools but in different formats"
+    },
+    "parameters": {
+        "session_id": "Unique identifier for the conversation session",
+        "instance_url": "Your CRM instance URL",
+        "instance_api_key": "Your CRM instance API key"
     }
+})
+
+@app.get("/usage")
+async def api_docs() -> Response:
+    """API documentation and usage examples."""
+    return Response(content=_API_DOCS_JSON, media_type="application/json")
+
 
 # --- Tools Test Endpoint (Simple) ---
 @app.get("/tools/test")
@@ -534,37 +749,38 @@ async def simple_tools():
 # --- Tools Listing Endpoint ---
 @app.get("/tools")
 async def list_tools(request: Request):
-    """List all available MCP tools with their descriptions and parameters."""
-    try:
-        from mcp import ClientSession, StdioServerParameters
-        from mcp.client.stdio import stdio_client
-
-        # Path to your CRM MCP server
-        crm_server_path = os.path.join(os.path.dirname(__file__), "servers", "crm_server.py")
-
-        # Read instance credentials from query params (optional)
-        instance_url = request.query_params.get("instance_url")
-        instance_api_key = request.query_params.get("instance_api_key")
-        print(f"Instance URL: {instance_url}")
-        print(f"Instance API Key: {instance_api_key}")
-        # Spawn a new MCP server process via stdio
-        server_params = StdioServerParameters(
-            command="python",
-            args=[crm_server_path, "--instance-url", instance_url, "--instance-api-key", instance_api_key]
-        )
+    """List all available MCP tools with their descriptions and parameters.
+    
+    Tools come from the pooled MCP session for the given credentials and are
+    cached for MCP_TOOLS_TTL_SECONDS. Pass ``cache=false`` to force a fresh
+    tools/list, or ``cache_ttl_seconds`` to accept a different maximum age.
+    """
+    instance_url = request.query_params.get("instance_url")
+    instance_api_key = request.query_params.get("instance_api_key")
+    if not instance_url:
+        raise HTTPException(status_code=400, detail="instance_url is required")
+    if not instance_api_key:
+        raise HTTPException(status_code=400, detail="instance_api_key is required")
 
-        tools_info = []
-        async with stdio_client(server_params) as (read, write):
-            session = ClientSession(read, write)
+    try:
+        if request.query_params.get("cache", "true").lower() == "false":
+            tools_max_age = 0
+        elif request.query_params.get("cache_ttl_seconds"):
+            tools_max_age = float(request.query_params["cache_ttl_seconds"])
+        else:
+            tools_max_age = None
 
-            # Load tools from MCP server
-            tools = await load_mcp_tools(session)
-            for tool in tools:
-                tools_info.append({
+        async with app.state.mcp_pool.acquire(
+            instance_url, instance_api_key, tools_max_age=tools_max_age
+        ) as (session, tools):
+            tools_info = [
+                {
                     "name": tool.name,
                     "description": tool.description,
-                    "schema": tool.args_schema.schema() if hasattr(tool, "args_schema") else None,
-                })
+                    "schema": _tool_schema(tool),
+                }
+                for tool in tools
+            ]
 
         return {
             "success": True,
@@ -574,9 +790,7 @@ async def list_tools(request: Request):
         }
 
     except Exception as e:
-        import traceback
-        print(f"❌ Error listing tools: {e}")
-        traceback.print_exc()
+        logger.exception("❌ Error listing tools")
 
         return {
             "success": False,
@@ -585,6 +799,14 @@ async def list_tools(request: Request):
         }
 
 
+def _tool_schema(tool):
+    """JSON schema for a tool's arguments (MCP tools already carry a dict)."""
+    args_schema = getattr(tool, "args_schema", None)
+    if args_schema is None or isinstance(args_schema, dict):
+        return args_schema
+    return args_schema.model_json_schema()
+
+
 def get_fallback_tools_response():
     """Return fallback tools response when MCP protocol fails."""
     fallback_tools = [
@@ -692,6 +914,117 @@ def get_fallback_tools_response():
         "note": "This is a static fallback when MCP tools/list cannot be reached"
     }
 
+# --- Agent run behind /messages ---
+async def run_agent(session_id: str, prompt: str, instance_url: str, instance_api_key: str, refresh: bool):
+    """Answer a /messages prompt, publishing progress and the response to the session's stream."""
+    response_text = ""
+    cancelled = False
+    try:
+        # Check if LLM is available
+        if not hasattr(app.state, 'llm') or app.state.llm is None:
+            response_text = "Error: LLM not initialized. Please check server logs."
+            return
+            
+        cacheable = True
+
+        def publish(item):
+            # Partial output is best effort: drop it if no stream is open
+            app.state.stream_sessions.publish(session_id, item)
+
+        async def compute():
+            nonlocal cacheable
+            async with app.state.mcp_pool.acquire(instance_url, instance_api_key) as (session, tools):
+                logger.debug(
+                    "Using pooled MCP session with %d tools", len(tools),
+                    extra={"session_id": session_id}
+                )
+                await wait_for_llm_warmup()
+                agent = get_agent(tools, AGENT_SYSTEM_PROMPT)
+                result = None
+                # "messages" yields model tokens as Gemini emits them;
+                # "values" yields the state after each step, the last of
+                # which is the final agent state
+                async for mode, data in agent.astream(
+                    {"messages": [HumanMessage(content=prompt)]},
+                    stream_mode=["messages", "values"]
+                ):
+                    if mode == "messages":
+                        chunk, _ = data
+                        # Tool results come through here too
+                        if isinstance(chunk, AIMessage):
+                            text = content_text(chunk.content)
+                            if text:
+                                publish(("token", text))
+                    else:
+                        result = data
+                        for tool_call in getattr(data["messages"][-1], "tool_calls", None) or ():
+                            publish(("tool", f"Calling {tool_call['name']}..."))
+                if result is None:
+                    raise RuntimeError("Agent run ended without a result")
+            logger.info(
+                "Agent run used cached input tokens",
+                extra={"session_id": session_id, "cached_input_tokens": cached_input_tokens(result["messages"])}
+            )
+            cacheable = is_read_only_run(result["messages"])
+            if not cacheable:
+                # The run changed CRM data; earlier answers for this instance may be stale
+                app.state.cache_manager.invalidate_instance(instance_url)
+            content = result["messages"][-1].content
+            # Convert content to string if it's a list (can happen with multimodal models)
+            if isinstance(content, list):
+                return ' '.join(str(item) for item in content)
+            return str(content) if content else ""
+
+        # Repeated read-only prompts are answered from the response cache
+        cache_data, was_cached = await app.state.cache_manager.get_or_compute(
+            prompt,
+            instance_url,
+            compute,
+            user_context=api_key_context(instance_api_key, "messages"),
+            should_cache=lambda: cacheable,
+            refresh=refresh
+        )
+        response_text = cache_data["response"]
+        if was_cached:
+            logger.debug("Serving cached response", extra={"session_id": session_id})
+    except asyncio.CancelledError:
+        # The client went away (see StreamSessionStore.track_task); nobody
+        # is left to read a response
+        logger.info("Agent run cancelled", extra={"session_id": session_id})
+        cancelled = True
+        raise
+    except Exception as e:
+        # Also covers ExceptionGroups from the MCP client; their traceback
+        # includes every sub-exception
+        logger.exception(
+            "Agent run failed",
+            extra={"session_id": session_id, "prompt_len": len(prompt)}
+        )
+        response_text = f"An error occurred: {e}"
+    finally:
+        # A cancelled run has nobody left to publish to
+        if not cancelled:
+            try:
+                # The full response goes out as one piece; log its size only,
+                # since the text carries CRM data
+                logger.debug(
+                    "Publishing response of %d chars", len(response_text),
+                    extra={"session_id": session_id}
+                )
+                # The session may have expired while the agent ran, so publish
+                # recreates it; the store's TTL reclaims it if nobody reads it.
+                # publish() never blocks on a full buffer with no reader.
+                stream_sessions = app.state.stream_sessions
+                stream_sessions.publish(session_id, response_text, create=True)
+                stream_sessions.publish(session_id, "END_STREAM", create=True)
+            except Exception:
+                logger.exception("Error publishing response to stream", extra={"session_id": session_id})
+
+    logger.debug(
+        "Agent completed", extra={"session_id": session_id, "response_len": len(response_text)}
+    )
+
+
 # --- Endpoint to receive the user's prompt ---
 @app.post("/messages")
 async def handle_prompt(request: Request):
@@ -700,6 +1033,8 @@ async def handle_prompt(request: Request):
     session_id = request.query_params.get("session_id")
     instance_url = request.query_params.get("instance_url")
     instance_api_key = request.query_params.get("instance_api_key") 
+    # cache=false skips a cached response and runs the agent again
+    refresh = request.query_params.get("cache", "true").lower() == "false"
     
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
@@ -712,154 +1047,31 @@ async def handle_prompt(request: Request):
     if not prompt:
         raise HTTPException(status_code=400, detail="prompt is required")
 
+    # Sessions are opened by /sse; never create one from here
+    if app.state.stream_sessions.get_buffer(session_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown session_id - open /sse first")
+
     print(f"Received prompt for session {session_id}: {prompt}")
-    print(f"Current message queues: {list(message_queues.keys())}")
-    print(f"Session {session_id} exists in queues: {session_id in message_queues}")
+    print(f"Active stream sessions: {len(app.state.stream_sessions)}")
 
     # Start the agent's work in a separate task so the POST request can return quickly
-    async def run_agent():
-        response_text = ""
-        try:
-            # Check if LLM is available
-            if not hasattr(app.state, 'llm') or app.state.llm is None:
-                response_text = "Error: LLM not initialized. Please check server logs."
-                return
-                
-            # Create server parameters with instance variables as command line arguments
-            # Use sys.executable to get the current Python interpreter path
-            import sys
-            import os
-            python_path = sys.executable
-            script_path = os.path.join(os.getcwd(), "servers", "crm_server.py")
-            
-            server_args = [python_path, script_path]
-            if instance_url:
-                server_args.extend(["--instance-url", instance_url])
-            if instance_api_key:
-                server_args.extend(["--instance-api-key", instance_api_key])
-            
-            print(f"DEBUG: Starting MCP server with args: {server_args}")
-            
-            # Debug: Check if the script exists and is executable
-            if os.path.exists(script_path):
-                print(f"DEBUG: Script exists at {script_path}")
-                if os.access(script_path, os.R_OK):
-                    print(f"DEBUG: Script is readable")
-                else:
-                    print(f"DEBUG: Script is NOT readable")
-                if os.access(script_path, os.X_OK):
-                    print(f"DEBUG: Script is executable")
-                else:
-                    print(f"DEBUG: Script is NOT executable")
-            else:
-                print(f"DEBUG: Script does NOT exist at {script_path}")
-                # List contents of /app/servers directory
-                try:
-                    import subprocess
-                    result = subprocess.run(["ls", "-la", "/app/servers"], capture_output=True, text=True)
-                    print(f"DEBUG: Contents of /app/servers: {result.stdout}")
-                except Exception as ls_error:
-                    print(f"DEBUG: Could not list /app/servers: {ls_error}")
-            
-            # Simple test to verify Python and script exist
-            print(f"DEBUG: Using Python path: {python_path}")
-            print(f"DEBUG: Using script path: {script_path}")
-            print(f"DEBUG: Script exists: {os.path.exists(script_path)}")
-            print(f"DEBUG: Script readable: {os.access(script_path, os.R_OK)}")
-            print(f"DEBUG: Script executable: {os.access(script_path, os.X_OK)}")
-            
-            stdio_server_params = StdioServerParameters(
-                command=python_path,
-                args=server_args[1:],  # Remove the first argument (python_path) since it's already in command
-            )
-            
-            print(f"DEBUG: About to start stdio client with params: {stdio_server_params}")
-            async with stdio_client(stdio_server_params) as (read, write):
-                print(f"DEBUG: stdio client started successfully")
-                try:
-                    async with ClientSession(read_stream=read, write_stream=write) as session:
-                        print(f"DEBUG: ClientSession created")
-                        try:
-                            await session.initialize()
-                            print(f"DEBUG: Session initialized")
-                        except Exception as init_error:
-                            print(f"DEBUG: Session initialization failed: {init_error}")
-                            raise Exception(f"MCP session initialization failed: {init_error}")
-                        
-                        try:
-                            tools = await load_mcp_tools(session)
-                            print(f"DEBUG: Loaded {len(tools)} tools")
-                        except Exception as tools_error:
-                            print(f"DEBUG: Failed to load MCP tools: {tools_error}")
-                            raise Exception(f"Failed to load MCP tools: {tools_error}")
-                        
-                        agent = create_agent(app.state.llm, tools)
-                        system_prompt = """You are an expert CRM assistant. When presenting data, always provide comprehensive, well-structured responses similar to professional AI assistants.
-
-                            RESPONSE FORMATTING RULES:
-                            1. Use clear headers and bullet points for readability
-                            2. Include ALL relevant details from the data
-                            3. Present information in logical groupings
-                            4. Always include UUIDs for future reference
-                            5. Highlight important relationships (companies, assignments)
-                            6. Use markdown-style formatting for structure
-
-                            For contact data, include:
-                            - Full contact details (name, email, phone, company)
-                            - System information (UUIDs, creation dates)
-                            - Relationships and associations
-                            - Any special notes or alerts
-
-                            Be thorough and professional - users expect detailed, actionable information."""
-                        enhanced_prompt = f"{system_prompt}\n\nUser request: {prompt}"
-                        result = await agent.ainvoke({"messages": [HumanMessage(content=enhanced_prompt)]})
-                        content = result["messages"][-1].content
-                        # Convert content to string if it's a list (can happen with multimodal models)
-                        if isinstance(content, list):
-                            response_text = ' '.join(str(item) for item in content)
-                        else:
-                            response_text = str(content) if content else ""
-                except Exception as session_error:
-                    print(f"DEBUG: MCP session error: {session_error}")
-                    raise session_error
-        except ExceptionGroup as eg:
-            import traceback
-            print(f"DEBUG: ExceptionGroup occurred: {eg}")
-            print(f"DEBUG: ExceptionGroup exceptions: {eg.exceptions}")
-            print(f"DEBUG: Full traceback: {traceback.format_exc()}")
-            response_text = f"An error occurred: {eg}"
-        except Exception as e:
-            import traceback
-            print(f"DEBUG: Error occurred: {e}")
-            print(f"DEBUG: Full traceback: {traceback.format_exc()}")
-            response_text = f"An error occurred: {e}"
-        finally:
-            try:
-                # Send the full response as one piece for testing
-                print(f"DEBUG: Total response length: {len(response_text)}")
-                print(f"DEBUG: Response text: {repr(response_text)}")
-                print(f"DEBUG: Sending full response to queue")
-                await message_queues[session_id].put(response_text)
-                
-                await message_queues[session_id].put("END_STREAM")
-            except Exception as queue_error:
-                print(f"DEBUG: Error putting message in queue: {queue_error}")
-
-        print(f"Agent completed for session {session_id}: {response_text}")
-    
-    # Create task with proper error handling
-    task = asyncio.create_task(run_agent())
+    task = asyncio.create_task(
+        run_agent(session_id, prompt, instance_url, instance_api_key, refresh),
+        name=f"agent-run:{session_id}"
+    )
     
     # Add error handler to the task
     def handle_task_exception(task):
+        if task.cancelled():
+            return
         try:
             task.result()
-        except Exception as e:
-            print(f"DEBUG: Task exception handled: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Agent task failed", extra={"session_id": session_id})
     
     task.add_done_callback(handle_task_exception)
+    # Stop the run if the client disconnects and doesn't come back
+    app.state.stream_sessions.track_task(session_id, task)
     
     return {
         "message": "Request accepted", 
@@ -875,28 +1087,14 @@ async def direct_query(request: Request):
     body = await request.json()
     instance_url = request.query_params.get("instance_url")
     instance_api_key = request.query_params.get("instance_api_key")
+    # cache=false skips a cached response and runs the agent again
+    refresh = request.query_params.get("cache", "true").lower() == "false"
     
     if not instance_url:
         raise HTTPException(status_code=400, detail="instance_url is required")
     if not instance_api_key:
         raise HTTPException(status_code=400, detail="instance_api_key is required")
 
-    #  # Step 1: Check cache first
-    # cache_manager = app.state.cache_manager
-    # cached_response = await cache_manager.get_cached_response(
-    #     query=request.prompt,
-    #     instance_url=request.instance_url,
-    #     user_context={"api_key_hash": hashlib.sha256(request.instance_api_key.encode()).hexdigest()[:8]}
-    # )
-    
-    # if cached_response:
-    #     return {
-    #         "response": cached_response.get("response", ""),
-    #         "success": True,
-    #         "cached": True,
-    #         "cached_at": cached_response.get("cached_at")
-    #     }
-        
     prompt = body.get("prompt")
     if not prompt:
         raise HTTPException(status_code=400, detail="prompt is required")
@@ -913,64 +1111,52 @@ async def direct_query(request: Request):
                 "timestamp": "2025-08-11T02:30:00Z"
             }
             
-        # Create server parameters with instance variables as command line arguments
-        server_args = ["/usr/local/bin/python", "/app/servers/crm_server.py"]
-        if instance_url:
-            server_args.extend(["--instance-url", instance_url])
-        if instance_api_key:
-            server_args.extend(["--instance-api-key", instance_api_key])
-        
-        stdio_server_params = StdioServerParameters(
-            command="/usr/local/bin/python",
-            args=server_args,
+        cacheable = True
+
+        async def compute():
+            nonlocal cacheable
+            # Reuse the pooled MCP session for these credentials
+            async with app.state.mcp_pool.acquire(instance_url, instance_api_key) as (session, tools):
+                await wait_for_llm_warmup()
+                # Compiled once per pooled tool list
+                agent = get_agent(tools)
+                
+                # ainvoke returns a dictionary
+                result = await agent.ainvoke(
+                    {"messages": [HumanMessage(content=prompt)]}
+                )
+            cacheable = is_read_only_run(result["messages"])
+            if not cacheable:
+                # The run changed CRM data; earlier answers for this instance may be stale
+                app.state.cache_manager.invalidate_instance(instance_url)
+            content = result["messages"][-1].content
+            # Convert content to string if it's a list (can happen with multimodal models)
+            if isinstance(content, list):
+                return ' '.join(str(item) for item in content)
+            return str(content) if content else ""
+
+        # Step 1: check the cache; on a miss run the agent and cache its answer
+        cache_manager = app.state.cache_manager
+        cache_data, was_cached = await cache_manager.get_or_compute(
+            prompt,
+            instance_url,
+            compute,
+            user_context=api_key_context(instance_api_key, "query"),
+            should_cache=lambda: cacheable,
+            refresh=refresh
         )
         
-        # Create a new MCP session for this request
-        async with stdio_client(stdio_server_params) as (read, write):
-            try:
-                async with ClientSession(read_stream=read, write_stream=write) as session:
-                    try:
-                        await session.initialize()
-                    except Exception as init_error:
-                        print(f"DEBUG: Session initialization failed: {init_error}")
-                        raise Exception(f"MCP session initialization failed: {init_error}")
-                    
-                    try:
-                        tools = await load_mcp_tools(session)
-                    except Exception as tools_error:
-                        print(f"DEBUG: Failed to load MCP tools: {tools_error}")
-                        raise Exception(f"Failed to load MCP tools: {tools_error}")
-                    
-                    
-                    # Create agent with tools for this request
-                    agent = create_agent(app.state.llm, tools)
-                    
-                    # ainvoke returns a dictionary
-                    result = await agent.ainvoke(
-                        {"messages": [HumanMessage(content=prompt)]}
-                    )
-                    content = result["messages"][-1].content
-                    # Convert content to string if it's a list (can happen with multimodal models)
-                    if isinstance(content, list):
-                        response_text = ' '.join(str(item) for item in content)
-                    else:
-                        response_text = str(content) if content else ""
-                    
-                    return {
-                        "success": True,
-                        "response": response_text,
-                        "prompt": prompt,
-                        "timestamp": "2025-08-11T02:30:00Z"
-                    }
-            except Exception as session_error:
-                print(f"DEBUG: MCP session error: {session_error}")
-                raise session_error
+        return {
+            "success": True,
+            "response": cache_data["response"],
+            "prompt": prompt,
+            "cached": was_cached,
+            "cached_at": cache_manager.cached_at_iso(cache_data) if was_cached else None,
+            "timestamp": "2025-08-11T02:30:00Z"
+        }
                 
     except ExceptionGroup as eg:
-        import traceback
-        print(f"ExceptionGroup in direct query: {eg}")
-        print(f"ExceptionGroup exceptions: {eg.exceptions}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("ExceptionGroup in direct query", extra={"prompt_len": len(prompt)})
         return {
             "success": False,
             "error": f"ExceptionGroup: {eg}",
@@ -978,9 +1164,7 @@ async def direct_query(request: Request):
             "timestamp": "2025-08-11T02:30:00Z"
         }
     except Exception as e:
-        import traceback
-        print(f"Error in direct query: {e}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in direct query", extra={"prompt_len": len(prompt)})
         return {
             "success": False,
             "error": str(e),
@@ -988,6 +1172,40 @@ async def direct_query(request: Request):
             "timestamp": "2025-08-11T02:30:00Z"
         }
 
+# --- Cache Management Endpoints ---
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache statistics."""
+    return {
+        "cache_stats": await app.state.cache_manager.get_cache_stats(),
+        "config": {
+            "enabled": ENABLE_CACHING,
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            "max_entries": CACHE_MAX_ENTRIES
+        }
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Gauges for the in-process SSE buffers and MCP session pool."""
+    return {
+        "stream_sessions": app.state.stream_sessions.get_stats(),
+        "mcp_pool": app.state.mcp_pool.get_stats()
+    }
+
+@app.post("/cache/clear")
+async def cache_clear(request: Request):
+    """Clear cached responses, optionally only those matching ?pattern=."""
+    pattern = request.query_params.get("pattern", "")
+    cleared = await app.state.cache_manager.clear_cache(pattern)
+    return {"success": True, "cleared": cleared}
+
+# --- SSE frames ---
+# Invariant frames are encoded once here rather than per event
+SSE_CONNECTED_FRAME = b"data: CONNECTED\n\n"
+SSE_KEEPALIVE_FRAME = b": keepalive\n\n"
+SSE_END_FRAME = b"data: END_STREAM\n\n"
+
 # --- Simple SSE Test Endpoint ---
 @app.get("/sse/test")
 async def test_sse():
@@ -995,73 +1213,139 @@ async def test_sse():
     print("🧪 SSE test endpoint called")
     
     async def test_generator():
-        yield "data: CONNECTED\n\n"
+        yield SSE_CONNECTED_FRAME
         await asyncio.sleep(1)
-        yield "data: Test message 1\n\n"
+        yield b"data: Test message 1\n\n"
         await asyncio.sleep(1)
-        yield "data: Test message 2\n\n"
+        yield b"data: Test message 2\n\n"
         await asyncio.sleep(1)
-        yield "data: END_STREAM\n\n"
+        yield SSE_END_FRAME
     
-    return StreamingResponse(test_generator(), media_type="text/event-stream")
+    return StreamingResponse(test_generator(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 # --- Endpoint for Server-Sent Events (SSE) streaming ---
-async def sse_generator(session_id: str):
-    """Generator to stream events to the client."""
-    # Ensure the message queue exists for this session
-    if session_id not in message_queues:
-        message_queues[session_id] = asyncio.Queue()
-        print(f"Created message queue for session {session_id}")
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx-style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+    # Keeps GZipMiddleware off the stream on Starlette versions that don't
+    # exclude text/event-stream themselves; compressing would hold frames back
+    "Content-Encoding": "identity"
+}
+
+
+def sse_frame(message, event: Optional[str] = None) -> bytes:
+    """Encode one queued message as an SSE data frame, optionally a named event."""
+    # Convert message to string if it's a list or other type
+    if isinstance(message, list):
+        message = ' '.join(str(item) for item in message)
+    elif not isinstance(message, str):
+        message = str(message)
+    # Escape newlines so the whole message stays within one data: line
+    frame = b"data: " + message.replace('\n', '\\n').encode("utf-8") + b"\n\n"
+    if event:
+        return sse_event_line(event) + frame
+    return frame
+
+
+@lru_cache(maxsize=None)
+def sse_event_line(event: str) -> bytes:
+    """The "event:" line for a named event; there are only a handful of names."""
+    return b"event: " + event.encode("utf-8") + b"\n"
+
+
+def entry_frames(entries) -> Tuple[bytes, bool]:
+    """Encode queued (event id, message) entries as one chunk.
+
+    Returns the chunk and whether it ends with END_STREAM.
+    """
+    frames = []
+    for event_id, message in entries:
+        if message == "END_STREAM":
+            frame = SSE_END_FRAME
+        elif isinstance(message, tuple):
+            # (event, data) from a streaming agent run
+            frame = sse_frame(message[1], message[0])
+        else:
+            frame = sse_frame(message)
+        if event_id is not None:
+            frame = b"id: %d\n" % event_id + frame
+        frames.append(frame)
+        if message == "END_STREAM":
+            return b"".join(frames), True
+    return b"".join(frames), False
+
+
+async def sse_generator(session_id: str, last_event_id: Optional[int] = None):
+    """Generator to stream events to the client.
+    
+    Everything already buffered when the generator wakes up is sent as a
+    single chunk, and an idle stream gets a comment frame every
+    SSE_KEEPALIVE_SECONDS. A reconnecting client that
+    sends its last event id first gets the events it missed.
+
+    Keep this (and any other StreamingResponse body) an async generator:
+    Starlette iterates sync iterators on the thread pool, one hop per chunk.
+    """
+    stream_sessions = app.state.stream_sessions
+    # Opening the stream creates the session if it's new
+    buffer = stream_sessions.open_stream(session_id)
 
     print(f"Starting SSE stream for session {session_id}")
     
+    # Events up to this id have already reached the client
+    sent_id = 0
     try:
         # Send an immediate connection confirmation
-        yield f"data: CONNECTED\n\n"
-        print(f"DEBUG: SSE generator sent CONNECTED message for session {session_id}")
+        yield SSE_CONNECTED_FRAME
+        logger.debug("SSE stream connected", extra={"session_id": session_id})
+
+        if last_event_id is not None:
+            missed = stream_sessions.replay(session_id, last_event_id)
+            if missed is not None:
+                sent_id = last_event_id
+            if missed:
+                logger.debug("Replaying missed SSE events", extra={"session_id": session_id, "events": len(missed)})
+                chunk, ended = entry_frames(missed)
+                sent_id = missed[-1][0]
+                yield chunk
+                if ended:
+                    return
 
         while True:
             try:
-                message = await message_queues[session_id].get()
-                print(f"DEBUG: SSE generator received message: {repr(message)}")
-                if message == "END_STREAM":
-                    print(f"DEBUG: SSE generator received END_STREAM")
-                    yield f"data: END_STREAM\n\n"
+                if not await buffer.wait(SSE_KEEPALIVE_SECONDS):
+                    yield SSE_KEEPALIVE_FRAME
+                    continue
+
+                # Skip anything the client already got from a replay
+                entries = [entry for entry in buffer.drain() if entry[0] is None or entry[0] > sent_id]
+                if not entries:
+                    continue
+
+                chunk, ended = entry_frames(entries)
+                logger.debug("Sending SSE events", extra={"session_id": session_id, "events": len(entries)})
+                yield chunk
+                if ended:
+                    logger.debug("SSE stream sent END_STREAM", extra={"session_id": session_id})
                     break
-                print(f"DEBUG: SSE generator yielding chunk: {repr(message)}")
-                # Properly format SSE data - escape newlines and ensure proper formatting
-                # Replace newlines with spaces for SSE compatibility
-                # Convert message to string if it's a list or other type
-                if isinstance(message, list):
-                    message = ' '.join(str(item) for item in message)
-                elif not isinstance(message, str):
-                    message = str(message)
-                escaped_message = message.replace('\n', '\\n')
-                # escaped_message = message.replace('\n', ' ')
-                yield f"data: {escaped_message}\n\n"
-                # Add a small delay to ensure the chunk is sent
-                await asyncio.sleep(0.01)
             except asyncio.CancelledError:
                 print(f"SSE stream cancelled for session {session_id}")
                 break
             except Exception as e:
-                print(f"DEBUG: Error in SSE stream for session {session_id}: {e}")
-                yield f"data: ERROR: {str(e)}\n\n"
+                logger.exception("Error in SSE stream", extra={"session_id": session_id})
+                yield sse_frame(f"ERROR: {str(e)}")
                 break
                 
     except Exception as e:
-        print(f"DEBUG: Critical error in SSE generator for session {session_id}: {e}")
-        import traceback
-        traceback.print_exc()
-        yield f"data: CRITICAL_ERROR: {str(e)}\n\n"
+        logger.exception("Critical error in SSE generator", extra={"session_id": session_id})
+        yield sse_frame(f"CRITICAL_ERROR: {str(e)}")
     finally:
         print(f"Stream ended for session {session_id}")
-        # Clean up the queue
         try:
-            if session_id in message_queues:
-                del message_queues[session_id]
-        except Exception as cleanup_error:
-            print(f"DEBUG: Error cleaning up queue for session {session_id}: {cleanup_error}")
+            stream_sessions.close_stream(session_id, buffer)
+        except Exception:
+            logger.warning("Error closing stream", exc_info=True, extra={"session_id": session_id})
 
 @app.get("/sse")
 async def sse(request: Request):
@@ -1071,20 +1355,51 @@ async def sse(request: Request):
     
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
+
+    # Browsers send Last-Event-ID when they reconnect on their own; clients
+    # that open a new EventSource pass it as a query parameter instead
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
     
-    return StreamingResponse(sse_generator(session_id), media_type="text/event-stream")
+    return StreamingResponse(
+        sse_generator(session_id, last_event_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
 # --- Main entry point ---
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.getenv("PORT", 8080))
+
+    # uvloop and httptools have no Windows builds and may be missing on dev
+    # machines; fall back to uvicorn's pure-Python loop and parser there
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
     print(f"🌐 Starting server on port {port}")
     print(f"🎨 UI available at: http://localhost:{port}/ui")
     print(f"📚 API docs available at: http://localhost:{port}/docs")
     
+    # Single process: SSE queues, pooled MCP sessions and the response cache
+    # live in memory. The auto-reloader is for local development (RELOAD=1).
     uvicorn.run(
         "main_with_ui:app",
         host="0.0.0.0",
         port=port,
-        reload=True
+        loop=loop,
+        http=http,
+        lifespan="on",
+        reload=os.getenv("RELOAD") == "1"
     )
 
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+import anyio
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger(__name__)
+
+CRM_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servers", "crm_server.py")
+
+# Raised when the server process or its pipes have gone away; the session is
+# dropped so the next acquire() spawns a fresh one.
+_DEAD_SESSION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+
+SessionKey = Tuple[str, str]
+
+
+class _PooledSession:
+    """A running CRM server subprocess with its initialized MCP session."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        # Resolves to (session, tools) once the handshake and tool load finish
+        self.ready: asyncio.Future = loop.create_future()
+        self.closing = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.session: Optional[ClientSession] = None
+        self.tools: List[BaseTool] = []
+        self.tools_loaded_at = 0.0
+        self.tools_lock = asyncio.Lock()
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class McpSessionPool:
+    """Long-lived MCP stdio sessions to the CRM server, one per credential pair.
+
+    Starting ``servers/crm_server.py``, running the MCP handshake and loading
+    its tools costs an interpreter start-up per request. The pool keeps each
+    session and its LangChain tools alive between requests and closes ones
+    that sit idle. The tool list is re-read from a live session once it is
+    older than ``tools_ttl_seconds``.
+
+    Every session is opened and closed by its own owner task, since the anyio
+    scopes inside ``stdio_client`` must be exited by the task that entered
+    them. Concurrent requests for a cold key share one start-up.
+    """
+
+    def __init__(
+        self,
+        idle_ttl_seconds: int = 300,
+        max_sessions: int = 32,
+        reap_interval_seconds: int = 30,
+        tools_ttl_seconds: int = 300
+    ):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self.tools_ttl_seconds = tools_ttl_seconds
+        self.reap_interval_seconds = reap_interval_seconds
+        # Least recently acquired first
+        self._sessions: "OrderedDict[SessionKey, _PooledSession]" = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        """Start the idle-session reaper."""
+        self._reaper = asyncio.create_task(self._reap_idle())
+        logger.info("✅ MCP session pool initialized")
+
+    async def close(self):
+        """Stop the reaper and shut down every pooled session."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+        entries = list(self._sessions.values())
+        self._sessions.clear()
+        for entry in entries:
+            entry.closing.set()
+        await asyncio.gather(*(entry.task for entry in entries), return_exceptions=True)
+        logger.info(f"🔌 Closed {len(entries)} MCP sessions")
+
+    @staticmethod
+    def server_params(instance_url: str, instance_api_key: str) -> StdioServerParameters:
+        """Parameters for spawning the CRM server with the current interpreter."""
+        return StdioServerParameters(
+            command=sys.executable,
+            args=[CRM_SERVER_PATH, "--instance-url", instance_url, "--instance-api-key", instance_api_key],
+        )
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        instance_url: str,
+        instance_api_key: str,
+        tools_max_age: Optional[float] = None
+    ) -> AsyncIterator[Tuple[ClientSession, List[BaseTool]]]:
+        """Borrow the session and tools for a credential pair, starting them on first use.
+        
+        ``tools_max_age`` overrides ``tools_ttl_seconds`` for this call; pass 0
+        to force a fresh tools/list.
+        """
+        key = (instance_url, instance_api_key)
+        entry = self._sessions.get(key)
+        if entry is None:
+            entry = self._start(key)
+        else:
+            self._sessions.move_to_end(key)
+
+        entry.in_use += 1
+        self._evict_overflow()
+        try:
+            session, _ = await asyncio.shield(entry.ready)
+            if tools_max_age is None:
+                tools_max_age = self.tools_ttl_seconds
+            tools = await self._fresh_tools(entry, tools_max_age)
+            yield session, tools
+        except _DEAD_SESSION_ERRORS:
+            logger.warning("⚠️ MCP session connection lost, discarding it")
+            self._discard(key, entry)
+            raise
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def get_stats(self):
+        """Get pool statistics."""
+        return {
+            "sessions": len(self._sessions),
+            "in_use": sum(1 for entry in self._sessions.values() if entry.in_use),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "tools_ttl_seconds": self.tools_ttl_seconds
+        }
+
+    def _start(self, key: SessionKey) -> _PooledSession:
+        entry = _PooledSession(asyncio.get_running_loop())
+        self._sessions[key] = entry
+        entry.task = asyncio.create_task(self._run_session(key, entry))
+        return entry
+
+    async def _run_session(self, key: SessionKey, entry: _PooledSession):
+        """Owner task: open the session, publish it, hold it until closing."""
+        try:
+            async with stdio_client(self.server_params(*key)) as (read, write):
+                async with ClientSession(read_stream=read, write_stream=write) as session:
+                    await session.initialize()
+                    tools = await load_mcp_tools(session)
+                    entry.session, entry.tools = session, tools
+                    entry.tools_loaded_at = time.monotonic()
+                    entry.ready.set_result((session, tools))
+                    logger.info(f"🔌 MCP session started with {len(tools)} tools")
+                    await entry.closing.wait()
+        except asyncio.CancelledError:
+            self._fail(entry, RuntimeError("MCP session was closed before it was ready"))
+            raise
+        except Exception as e:
+            logger.error(f"❌ MCP session error: {e}")
+            self._fail(entry, e)
+        finally:
+            self._discard(key, entry)
+
+    @staticmethod
+    async def _fresh_tools(entry: _PooledSession, max_age: float) -> List[BaseTool]:
+        """Return the entry's tools, reloading them once if older than max_age."""
+        if time.monotonic() - entry.tools_loaded_at <= max_age:
+            return entry.tools
+        async with entry.tools_lock:
+            # Another caller may have refreshed while we waited
+            if time.monotonic() - entry.tools_loaded_at > max_age:
+                entry.tools = await load_mcp_tools(entry.session)
+                entry.tools_loaded_at = time.monotonic()
+        return entry.tools
+
+    @staticmethod
+    def _fail(entry: _PooledSession, error: Exception):
+        if not entry.ready.done():
+            entry.ready.set_exception(error)
+            # Mark the exception as retrieved when nobody else was waiting
+            entry.ready.exception()
+
+    def _discard(self, key: SessionKey, entry: _PooledSession):
+        """Remove an entry from the pool and let its owner task shut it down."""
+        if self._sessions.get(key) is entry:
+            del self._sessions[key]
+        entry.closing.set()
+
+    def _evict_overflow(self):
+        """Close least recently used idle sessions while over max_sessions."""
+        while len(self._sessions) > self.max_sessions:
+            victim = next(
+                ((key, entry) for key, entry in self._sessions.items() if not entry.in_use),
+                None
+            )
+            if victim is None:
+                break
+            self._discard(*victim)
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(self.reap_interval_seconds)
+            cutoff = time.monotonic() - self.idle_ttl_seconds
+            idle = [
+                (key, entry) for key, entry in self._sessions.items()
+                if not entry.in_use and entry.last_used < cutoff
+            ]
+            for key, entry in idle:
+                self._discard(key, entry)
+            if idle:
+                logger.info(f"🧹 Closed {len(idle)} idle MCP sessions")
@@ -1,10 +1,18 @@
 import asyncio
-import requests
+import functools
+import inspect
+import importlib.util
+import httpx
 import argparse
 import sys
 import os
 import logging
-from typing import Dict, Any
+import anyio
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 from mcp.server.fastmcp import FastMCP
 import json # Added for json.JSONDecodeError
 
@@ -54,16 +62,46 @@ def get_mcp():
         _mcp_instance = FastMCP("crm-server")
     return _mcp_instance
 
+def run_in_thread(fn):
+    """Wrap a blocking tool so FastMCP awaits it on a worker thread.
+
+    FastMCP calls sync tools inline on its event loop, which serializes
+    concurrent tools/call requests; the agent issues independent tool calls
+    in parallel, so each one needs to run off the loop.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+    return wrapper
+
 # Create a proxy object that delegates to the actual FastMCP instance
 class MCPProxy:
     def tool(self, *args, **kwargs):
-        return get_mcp().tool(*args, **kwargs)
+        register = get_mcp().tool(*args, **kwargs)
+
+        def decorator(fn):
+            register(fn if inspect.iscoroutinefunction(fn) else run_in_thread(fn))
+            # Keep the plain function importable/callable from this module
+            return fn
+        return decorator
     
     def run(self, *args, **kwargs):
         return get_mcp().run(*args, **kwargs)
 
 mcp = MCPProxy()
 
+# One pooled client for every CRM call this process makes: tools run on
+# worker threads and the agent chains several of them, so reusing
+# connections saves a TCP/TLS handshake per call. With the h2 package
+# installed, instances that offer HTTP/2 (negotiated via ALPN) carry
+# parallel tool calls as streams on one connection; others get HTTP/1.1.
+http_session = httpx.Client(
+    http2=importlib.util.find_spec("h2") is not None,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    # Match requests, which followed redirects by default
+    follow_redirects=True,
+)
+
 # Utility: API Request
 def fetch_api_data(endpoint: str) -> Dict[str, Any]:
     if not INSTANCE_URL or not INSTANCE_API_KEY:
@@ -80,7 +118,7 @@ def fetch_api_data(endpoint: str) -> Dict[str, Any]:
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)  # Add timeout
+        response = http_session.get(url, headers=headers, timeout=30)  # Add timeout
         
         # Check if response is HTML instead of JSON
         content_type = response.headers.get('content-type', '').lower()
@@ -113,11 +151,92 @@ def fetch_api_data(endpoint: str) -> Dict[str, Any]:
                 "error": response.text,
                 "content_type": content_type
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {"success": False, "error": "Request timed out after 30 seconds"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# -------------------------
+# Result Handles
+# -------------------------
+# List results larger than this (serialized bytes) are kept server-side and
+# returned to the model as a handle plus a short preview; 0 disables handles.
+RESULT_HANDLE_BYTES = int(os.getenv("CRM_RESULT_HANDLE_BYTES", "4096"))
+MAX_RESULT_HANDLES = 128
+PREVIEW_ROWS = 3
+
+_result_handles: "OrderedDict[str, Any]" = OrderedDict()
+_result_handles_lock = threading.Lock()
+
+# Path segments understood by fetch_handle: .key, [index], [start:stop]
+_PATH_SEGMENT = re.compile(r"\.?([^.\[\]]+)|\[(-?\d*):(-?\d*)\]|\[(-?\d+)\]")
+
+def _result_rows(data: Any) -> Optional[List[Any]]:
+    """The record list in an API result: the result itself or its first list value."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+    return None
+
+def as_handle(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a large successful result with a crm:// handle and a preview.
+
+    The payload is stored under the hash of its serialized form so the same
+    data fetched twice shares one entry; fetch_handle reads it back in slices.
+    """
+    if not RESULT_HANDLE_BYTES or not result.get("success") or "result" not in result:
+        return result
+    data = result["result"]
+    payload = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    if len(payload) <= RESULT_HANDLE_BYTES:
+        return result
+
+    handle = f"crm://{hashlib.sha256(payload).hexdigest()[:32]}"
+    with _result_handles_lock:
+        _result_handles[handle] = data
+        _result_handles.move_to_end(handle)
+        while len(_result_handles) > MAX_RESULT_HANDLES:
+            _result_handles.popitem(last=False)
+
+    rows = _result_rows(data)
+    summary: Dict[str, Any] = {
+        "success": True,
+        "handle": handle,
+        "size_bytes": len(payload),
+        "message": "Result too large to inline. Call fetch_handle with this handle (and optionally a path) to read it."
+    }
+    if rows is not None:
+        summary["row_count"] = len(rows)
+        summary["schema_preview"] = rows[:PREVIEW_ROWS]
+    elif isinstance(data, dict):
+        summary["keys"] = list(data)
+    return summary
+
+def select_path(data: Any, path: str) -> Any:
+    """Resolve a simple JSONPath-like expression such as $.results[0:10] or results.0.email."""
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    pos = 0
+    while pos < len(path):
+        match = _PATH_SEGMENT.match(path, pos)
+        if not match:
+            raise ValueError(f"Unsupported path segment: {path[pos:]}")
+        key, start, stop, index = match.groups()
+        if index is not None:
+            data = data[int(index)]
+        elif start is not None:
+            data = data[int(start) if start else None:int(stop) if stop else None]
+        elif isinstance(data, list):
+            data = data[int(key)]
+        else:
+            data = data[key]
+        pos = match.end()
+    return data
+
 # MCP Tools
 @mcp.tool()
 def get_contacts() -> Dict[str, Any]:
@@ -134,7 +253,7 @@ def get_contacts() -> Dict[str, Any]:
     logger.info("Calling get_contacts tool...")
     result = fetch_api_data("/crm/api/v2/contacts")
     logger.info(f"get_contacts tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_contact_relationships() -> Dict[str, Any]:
@@ -151,7 +270,7 @@ def get_contact_relationships() -> Dict[str, Any]:
     logger.info("Calling get_contact_relationships tool...")
     result = fetch_api_data("/crm/api/v2/contacts/relationships")
     logger.info(f"get_contact_relationships tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_contact_addresses() -> Dict[str, Any]:
@@ -168,7 +287,7 @@ def get_contact_addresses() -> Dict[str, Any]:
     logger.info("Calling get_contact_addresses tool...")
     result = fetch_api_data("/crm/api/v2/contacts/addresses")
     logger.info(f"get_contact_addresses tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_companies() -> Dict[str, Any]:
@@ -185,42 +304,42 @@ def get_companies() -> Dict[str, Any]:
     logger.info("Calling get_companies tool...")
     result = fetch_api_data("/crm/api/v2/companies")
     logger.info(f"get_companies tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_company_relationships() -> Dict[str, Any]:
     logger.info("Calling get_company_relationships tool...")
     result = fetch_api_data("/crm/api/v2/companies/relationships")
     logger.info(f"get_company_relationships tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_company_addresses() -> Dict[str, Any]:
     logger.info("Calling get_company_addresses tool...")
     result = fetch_api_data("/crm/api/v2/companies/addresses")
     logger.info(f"get_company_addresses tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_system_fields() -> Dict[str, Any]:
     logger.info("Calling get_system_fields tool...")
     result = fetch_api_data("/crm/api/v2/system-fields")
     logger.info(f"get_system_fields tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_contact_sytem_fields() -> Dict[str, Any]:
     logger.info("Calling get_contact_sytem_fields tool...")
     result = fetch_api_data("/crm/api/v2/custom-fields/contacts")
     logger.info(f"get_contact_sytem_fields tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_company_sytem_fields() -> Dict[str, Any]:
     logger.info("Calling get_company_sytem_fields tool...")
     result = fetch_api_data("/crm/api/v2/custom-fields/companies")
     logger.info(f"get_company_sytem_fields tool finished. Result: {result}")
-    return result
+    return as_handle(result)
 
 @mcp.tool()
 def get_contact_addresses_by_uuid(contact_uuid: str) -> Dict[str, Any]:
@@ -260,7 +379,7 @@ def get_contact_addresses_by_uuid(contact_uuid: str) -> Dict[str, Any]:
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_session.get(url, headers=headers, timeout=30)
         logger.info(f"get_contact_addresses_by_uuid tool finished. Response status: {response.status_code}")
         
         # Check if response is HTML instead of JSON
@@ -301,7 +420,7 @@ def get_contact_addresses_by_uuid(contact_uuid: str) -> Dict[str, Any]:
                 "error": response.text,
                 "content_type": content_type
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.warning(f"Request timed out for get_contact_addresses_by_uuid for contact UUID: {contact_uuid}")
         return {"success": False, "error": "Request timed out after 30 seconds"}
     except Exception as e:
@@ -335,7 +454,7 @@ def get_contact_by_uuid(contact_uuid: str) -> Dict[str, Any]:
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_session.get(url, headers=headers, timeout=30)
         logger.info(f"get_contact_by_uuid tool finished. Response status: {response.status_code}")
         
         # Check if response is HTML instead of JSON
@@ -375,7 +494,7 @@ def get_contact_by_uuid(contact_uuid: str) -> Dict[str, Any]:
                 "error": response.text,
                 "content_type": content_type
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.warning(f"Request timed out for get_contact_by_uuid for UUID: {contact_uuid}")
         return {"success": False, "error": "Request timed out after 30 seconds"}
     except Exception as e:
@@ -473,9 +592,9 @@ def create_contact_address(address_data: Dict[str, Any]) -> Dict[str, Any]:
 
     try:
         if method == "POST":
-            response = requests.post(url, headers=headers, json=address_data, timeout=30)
+            response = http_session.post(url, headers=headers, json=address_data, timeout=30)
         else:
-            response = requests.put(url, headers=headers, json=address_data, timeout=30)
+            response = http_session.put(url, headers=headers, json=address_data, timeout=30)
         
         logger.info(f"create_contact_address tool finished. Response status: {response.status_code}")
         
@@ -522,7 +641,7 @@ def create_contact_address(address_data: Dict[str, Any]) -> Dict[str, Any]:
                 "error": response.text,
                 "content_type": content_type
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         action = "update" if is_update else "create"
         logger.warning(f"Request timed out for {action} address for contact UUID: {contact_uuid}")
         return {"success": False, "error": "Request timed out after 30 seconds"}
@@ -634,7 +753,7 @@ def save_contact(contact_data: Dict[str, Any]) -> Dict[str, Any]:
             # Update existing contact
             contact_uuid = contact_data["uuid"]
             url = f"{INSTANCE_URL}/crm/api/v2/contacts/{contact_uuid}"
-            response = requests.put(url, headers=headers, json=contact_data, timeout=30)
+            response = http_session.put(url, headers=headers, json=contact_data, timeout=30)
             logger.info(f"Attempting to update contact with UUID: {contact_uuid}")
             
             # Log existing addresses for the contact being updated
@@ -649,7 +768,7 @@ def save_contact(contact_data: Dict[str, Any]) -> Dict[str, Any]:
                 logger.warning(f"Error checking existing addresses for contact {contact_uuid}: {str(e)}")
         else:
             # Create new contact
-            response = requests.post(url, headers=headers, json=contact_data, timeout=30)
+            response = http_session.post(url, headers=headers, json=contact_data, timeout=30)
             logger.info("Attempting to create new contact")
         
         logger.info(f"save_contact tool finished. Response status: {response.status_code}")
@@ -720,7 +839,7 @@ def save_contact(contact_data: Dict[str, Any]) -> Dict[str, Any]:
                 "status_code": response.status_code,
                 "error": response.text
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.warning("Request timed out for save_contact")
         return {"success": False, "error": "Request timed out after 30 seconds"}
     except Exception as e:
@@ -796,13 +915,43 @@ def check_entity_exists(endpoint: str, uuid_value: str) -> bool:
             "Accept": "application/json"
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_session.get(url, headers=headers, timeout=10)
         return response.status_code == 200
     except:
         # If we can't verify, assume it's valid to avoid blocking the save operation
         # In production, you might want to log this and handle it differently
         return True
 
+@mcp.tool()
+def fetch_handle(handle: str, jsonpath: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read data behind a crm:// handle returned by another tool.
+
+    Args:
+        handle: The handle, e.g. "crm://3f2a..."
+        jsonpath: Optional path selecting part of the data, e.g. "$.results[0:10]",
+            "$.results[3].email". Omit it to return the whole payload.
+
+    Returns:
+        Dictionary with the selected data or error information
+    """
+    logger.info(f"Calling fetch_handle tool with handle: {handle}, jsonpath: {jsonpath}")
+    with _result_handles_lock:
+        if handle not in _result_handles:
+            return {
+                "success": False,
+                "error": f"Unknown or expired handle: {handle}. Call the original tool again."
+            }
+        data = _result_handles[handle]
+        _result_handles.move_to_end(handle)
+
+    if jsonpath:
+        try:
+            data = select_path(data, jsonpath)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return {"success": False, "error": f"Path {jsonpath!r} not found in {handle}: {e}"}
+    return {"success": True, "handle": handle, "result": data}
+
 # -------------------------
 # Tool Information
 # -------------------------
@@ -891,6 +1040,15 @@ def list_available_tools() -> Dict[str, Any]:
         #     },
         #     "returns": "Contact data or error information"
         # },
+        {
+            "name": "Fetch Handle",
+            "description": "Read the data behind a crm:// handle returned for large results",
+            "parameters": {
+                "handle": "string - The crm:// handle",
+                "jsonpath": "string (optional) - Path selecting part of the data, e.g. $.results[0:10]"
+            },
+            "returns": "The selected data or error information"
+        },
         {
             "name": "Save contact",
             "description": "Save or update a contact in the CRM module",
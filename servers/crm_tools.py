@@ -1,7 +1,9 @@
 import requests
 import json
 import logging
+from http.cookiejar import DefaultCookiePolicy
 from typing import Dict, Any, List, Optional
+from requests.adapters import HTTPAdapter
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
@@ -34,17 +36,49 @@ class CompaniesParams(BaseModel):
     keyword: Optional[str] = Field(default=None, description="Search keyword")
     sort_order: Optional[str] = Field(default="ASC", description="Sort order: ASC or DESC")
 
+def create_http_session(pool_maxsize: int = 32) -> requests.Session:
+    """Create a pooled HTTP session for CRM API calls.
+    
+    Credentials are sent per request, so one session can serve every
+    instance and keeps TCP/TLS connections alive between tool calls.
+    Cookies are refused, so nothing set by one tenant's responses is
+    replayed on another tenant's requests.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Global shared session, used when CRMTools isn't given one
+_http_session: Optional[requests.Session] = None
+
+
+def get_http_session() -> requests.Session:
+    """Get or create the process-wide CRM HTTP session."""
+    global _http_session
+    if _http_session is None:
+        _http_session = create_http_session()
+    return _http_session
+
+
 class CRMTools:
     """CRM Tools class that provides all CRM-related functionality."""
     
-    def __init__(self, instance_url: str, instance_api_key: str):
+    def __init__(self, instance_url: str, instance_api_key: str, session: Optional[requests.Session] = None):
         self.instance_url = instance_url
         self.instance_api_key = instance_api_key
+        # Shared pooled session; per-instance auth goes in the request headers
+        self.session = session or get_http_session()
         self.headers = {
             "Authorization": instance_api_key,
             "Accept": "application/json",
             "Content-Type": "application/json"
         }
+        # Built on the first get_langchain_tools() call
+        self._langchain_tools: Optional[List] = None
     
     def _fetch_api_data(self, endpoint: str) -> Dict[str, Any]:
         """Utility method to fetch data from CRM API."""
@@ -57,7 +91,7 @@ class CRMTools:
         url = f"{self.instance_url}{endpoint}"
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=self.headers, timeout=30)
             
             # Check if response is HTML instead of JSON
             content_type = response.headers.get('content-type', '').lower()
@@ -254,11 +288,11 @@ class CRMTools:
                 # Update existing contact
                 contact_uuid = contact_data["uuid"]
                 url = f"{self.instance_url}/crm/api/v2/contacts/{contact_uuid}"
-                response = requests.put(url, headers=self.headers, json=contact_data, timeout=30)
+                response = self.session.put(url, headers=self.headers, json=contact_data, timeout=30)
                 logger.info(f"Updating contact with UUID: {contact_uuid}")
             else:
                 # Create new contact
-                response = requests.post(url, headers=self.headers, json=contact_data, timeout=30)
+                response = self.session.post(url, headers=self.headers, json=contact_data, timeout=30)
                 logger.info("Creating new contact")
             
             if response.status_code in [200, 201]:
@@ -303,7 +337,7 @@ class CRMTools:
         url = f"{self.instance_url}/crm/api/v2/companies"
         
         try:
-            response = requests.post(url, headers=self.headers, json=company_data, timeout=30)
+            response = self.session.post(url, headers=self.headers, json=company_data, timeout=30)
             
             if response.status_code in [200, 201]:
                 try:
@@ -353,7 +387,7 @@ class CRMTools:
         payload = {k: v for k, v in company_data.items() if k != "uuid"}
         
         try:
-            response = requests.put(url, headers=self.headers, json=payload, timeout=30)
+            response = self.session.put(url, headers=self.headers, json=payload, timeout=30)
             
             if response.status_code == 200:
                 try:
@@ -396,7 +430,7 @@ class CRMTools:
         url = f"{self.instance_url}/crm/api/v2/contacts/{contact_uuid}"
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=self.headers, timeout=30)
             
             if response.status_code == 200:
                 try:
@@ -422,7 +456,9 @@ class CRMTools:
             return {"success": False, "error": str(e)}
 
     def get_langchain_tools(self) -> List:
-        """Convert CRM methods to LangChain tools."""
+        """Convert CRM methods to LangChain tools (built once per instance)."""
+        if self._langchain_tools is not None:
+            return self._langchain_tools
         tools = []
         
         # Create tool functions that capture self in closure
@@ -582,4 +618,5 @@ class CRMTools:
             get_contact_by_uuid
         ])
         
+        self._langchain_tools = tools
         return tools
\ No newline at end of file
@@ -10,19 +10,38 @@ import base64
 import jwt
 import re
 from utils.secret_manager import get_secret, get_secret_manager
+from servers.crm_tools import create_http_session
 import uuid 
 import os
 # Logger is configured in main.py - just get the logger here
 logger = logging.getLogger(__name__)
 
+# Console gateway session, used when InstanceTools isn't given one; kept
+# apart from the CRM session that carries tenant traffic
+_console_session: Optional[requests.Session] = None
+
+
+def get_console_session() -> requests.Session:
+    """Get or create the process-wide Console gateway HTTP session."""
+    global _console_session
+    if _console_session is None:
+        _console_session = create_http_session()
+    return _console_session
+
+
 class InstanceTools:
     """Instance Management Tools for Insites instance operations."""
     
     def __init__(
         self, 
         console_email: str = "",
+        *,
+        session: Optional[requests.Session] = None,
     ):
         self.console_email = console_email
+        # Pooled cookie-less session, so repeated gateway calls reuse connections
+        self.session = session or get_console_session()
+
     def _encrypt_token(self, token: str, secret_key: str) -> str:
         """Encrypt JWT token using AES-256-CBC to match Insites encrypt filter format.
         
@@ -132,7 +151,7 @@ class InstanceTools:
             logger.info(f"[Database API] Sending POST request to: {api_url}")
             logger.info(f"[Database API] Payload: {json.dumps(payload, indent=2)}")
             
-            response = requests.post(
+            response = self.session.post(
                 api_url,
                 headers=headers,
                 json=payload,
@@ -353,7 +372,7 @@ class InstanceTools:
             logger.info(f"[VALIDATE_SUBDOMAIN] URL: {url}")
             logger.info(f"[VALIDATE_SUBDOMAIN] Params: {params}")
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self.session.get(url, headers=headers, params=params, timeout=30)
             
             logger.info(f"[VALIDATE_SUBDOMAIN] Response status: {response.status_code}")
             
@@ -507,7 +526,7 @@ class InstanceTools:
             }
             
             logger.info(f"[AWS Gateway] Sending create instance request to: {endpoint}")
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=60)
+            response = self.session.post(endpoint, headers=headers, json=payload, timeout=60)
             
             if response.status_code in [200, 201]:
                 try:
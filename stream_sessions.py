@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sentinel the SSE stream treats as the end of a response
+END_STREAM = "END_STREAM"
+
+# (event id, item) as buffered and kept for replay; internal sentinels have no id
+Entry = Tuple[Optional[int], Any]
+
+
+class StreamBuffer:
+    """Entries waiting to be sent on a session's stream.
+
+    A deque plus one Event instead of an asyncio.Queue: publishing a token is
+    an append and (at most) one wake-up, with no future per item, and the
+    reader takes everything pending in one go. anyio memory object streams
+    are slower still (a checkpoint per send and receive) and don't fit this
+    publish-without-waiting path.
+    """
+
+    __slots__ = ("entries", "ready", "max_size")
+
+    def __init__(self, max_size: int = 0):
+        self.entries: "deque[Entry]" = deque()
+        self.ready = asyncio.Event()
+        # 0 means unbounded
+        self.max_size = max_size
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def push(self, entry: Entry) -> bool:
+        """Append an entry and wake the reader; returns True if the oldest was dropped."""
+        dropped = bool(self.max_size) and len(self.entries) >= self.max_size
+        if dropped:
+            self.entries.popleft()
+        self.entries.append(entry)
+        self.ready.set()
+        return dropped
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until entries are pending; returns False on timeout."""
+        if self.entries:
+            return True
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def drain(self) -> List[Entry]:
+        """Take every pending entry."""
+        entries = list(self.entries)
+        self.entries.clear()
+        self.ready.clear()
+        return entries
+
+
+class _StreamSession:
+    __slots__ = ("buffer", "last_used", "streams", "history", "next_id", "tasks", "abandon_timer")
+
+    def __init__(self, max_queue_size: int = 0, replay_size: int = 256):
+        self.buffer = StreamBuffer(max_queue_size)
+        self.last_used = time.monotonic()
+        # Number of SSE connections currently reading this buffer
+        self.streams = 0
+        # Recently published entries, replayed to clients that reconnect
+        self.history: "deque[Entry]" = deque(maxlen=replay_size)
+        self.next_id = 1
+        # Agent runs producing into this session
+        self.tasks: Set[asyncio.Task] = set()
+        # Pending cancellation of those runs while no stream is attached
+        self.abandon_timer: Optional[asyncio.TimerHandle] = None
+
+
+class StreamSessionStore:
+    """Bounded store of per-session stream buffers for SSE streaming.
+
+    Sessions are only created when a stream is opened (or explicitly with
+    ``create=True``), never as a side effect of a lookup, so probing random
+    session ids doesn't allocate anything. The store holds at most
+    ``max_sessions`` sessions, dropping the least recently used, and a
+    sweeper removes sessions with no open stream that have been idle for
+    ``idle_ttl_seconds``.
+
+    Each buffer holds at most ``max_queue_size`` items. ``publish`` never
+    waits for a slow or absent reader; when a buffer is full it drops the
+    oldest item, which is a streamed token the final response supersedes.
+
+    Published items get increasing per-session event ids and the last
+    ``replay_size`` are kept, so a client reconnecting with ``Last-Event-ID``
+    gets what it missed. A session outlives its last stream until the idle
+    sweep, which is the window for such reconnects.
+
+    Agent runs registered with ``track_task`` are cancelled once the session
+    has had no stream for ``abandon_grace_seconds``, or when it is removed,
+    so a client that went away doesn't keep an LLM run going.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10_000,
+        idle_ttl_seconds: int = 600,
+        sweep_interval_seconds: int = 60,
+        max_queue_size: int = 256,
+        replay_size: int = 256,
+        abandon_grace_seconds: float = 30
+    ):
+        self.max_sessions = max_sessions
+        self.max_queue_size = max_queue_size
+        self.replay_size = replay_size
+        self.abandon_grace_seconds = abandon_grace_seconds
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        # Least recently used first
+        self._sessions: "OrderedDict[str, _StreamSession]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+        # Messages dropped from full buffers
+        self._dropped = 0
+        # Agent runs cancelled because their stream was abandoned
+        self._cancelled = 0
+
+    async def initialize(self):
+        """Start the idle-session sweeper."""
+        self._sweeper = asyncio.create_task(self._sweep_idle())
+        logger.info("✅ Stream session store initialized")
+
+    async def close(self):
+        """Stop the sweeper and end every open stream."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        for session_id in list(self._sessions):
+            self.discard(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_buffer(self, session_id: str, create: bool = False) -> Optional[StreamBuffer]:
+        """Return the session's buffer, or None if it doesn't exist and create is False."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._add(session_id)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session.buffer
+
+    def publish(self, session_id: str, item, create: bool = False) -> bool:
+        """Queue an item for a session without blocking.
+
+        Returns False if the session doesn't exist and create is False.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return False
+            session = self._add(session_id)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+
+        entry = (session.next_id, item)
+        session.next_id += 1
+        session.history.append(entry)
+        if session.buffer.push(entry):
+            self._dropped += 1
+        return True
+
+    def replay(self, session_id: str, last_event_id: int) -> Optional[List[Entry]]:
+        """Entries published after last_event_id.
+
+        Returns None if the id doesn't belong to this session's current
+        history (e.g. the session expired and was recreated since).
+        """
+        session = self._sessions.get(session_id)
+        if session is None or last_event_id >= session.next_id:
+            return None
+        return [entry for entry in session.history if entry[0] > last_event_id]
+
+    def get_stats(self):
+        """Get store statistics, including buffer depths."""
+        depths = [len(session.buffer) for session in self._sessions.values()]
+        return {
+            "sessions": len(self._sessions),
+            "open_streams": sum(session.streams for session in self._sessions.values()),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "max_queue_size": self.max_queue_size,
+            "dropped_messages": self._dropped,
+            "replay_size": self.replay_size,
+            "running_tasks": sum(len(session.tasks) for session in self._sessions.values()),
+            "cancelled_tasks": self._cancelled,
+            "max_sessions": self.max_sessions
+        }
+
+    def open_stream(self, session_id: str) -> StreamBuffer:
+        """Attach an SSE connection to a session, creating it if needed."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._add(session_id)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.streams += 1
+        session.last_used = time.monotonic()
+        if session.abandon_timer is not None:
+            session.abandon_timer.cancel()
+            session.abandon_timer = None
+        return session.buffer
+
+    def close_stream(self, session_id: str, buffer: StreamBuffer):
+        """Detach an SSE connection.
+
+        The session is kept for reconnects; the idle sweep removes it. If this
+        was its last stream, its agent runs are cancelled unless a stream
+        reattaches within ``abandon_grace_seconds``.
+        """
+        session = self._sessions.get(session_id)
+        if session is None or session.buffer is not buffer:
+            return
+        session.streams = max(session.streams - 1, 0)
+        session.last_used = time.monotonic()
+        if not session.streams and session.tasks:
+            self._schedule_abandon(session_id, session)
+
+    def track_task(self, session_id: str, task: asyncio.Task) -> bool:
+        """Tie an agent run to a session so it stops when nobody is listening.
+
+        Returns False if the session doesn't exist.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        session.tasks.add(task)
+        task.add_done_callback(session.tasks.discard)
+        if not session.streams:
+            self._schedule_abandon(session_id, session)
+        return True
+
+    def discard(self, session_id: str):
+        """Remove a session, ending any stream still reading from it."""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        if session.streams:
+            if session.buffer.push((None, END_STREAM)):
+                self._dropped += 1
+        self._cancel_tasks(session_id, session)
+
+    def _schedule_abandon(self, session_id: str, session: _StreamSession):
+        if session.abandon_timer is not None:
+            session.abandon_timer.cancel()
+        session.abandon_timer = asyncio.get_running_loop().call_later(
+            self.abandon_grace_seconds, self._cancel_if_abandoned, session_id, session
+        )
+
+    def _cancel_if_abandoned(self, session_id: str, session: _StreamSession):
+        session.abandon_timer = None
+        if self._sessions.get(session_id) is session and not session.streams:
+            self._cancel_tasks(session_id, session)
+
+    def _cancel_tasks(self, session_id: str, session: _StreamSession):
+        if session.abandon_timer is not None:
+            session.abandon_timer.cancel()
+            session.abandon_timer = None
+        pending = [task for task in session.tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            self._cancelled += len(pending)
+            logger.info(f"🛑 Cancelled {len(pending)} agent runs for abandoned session {session_id}")
+
+    def _add(self, session_id: str) -> _StreamSession:
+        session = _StreamSession(self.max_queue_size, self.replay_size)
+        self._sessions[session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            logger.warning(f"⚠️ Stream session limit reached, dropping {oldest}")
+            self.discard(oldest)
+        return session
+
+    async def _sweep_idle(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            cutoff = time.monotonic() - self.idle_ttl_seconds
+            idle = [
+                session_id for session_id, session in self._sessions.items()
+                if not session.streams and session.last_used < cutoff
+            ]
+            for session_id in idle:
+                self.discard(session_id)
+            if idle:
+                logger.info(f"🧹 Removed {len(idle)} idle stream sessions")
@@ -0,0 +1,18 @@
+"""
+orjson-backed JSON responses.
+FastAPI's own ORJSONResponse is deprecated in favour of Pydantic
+serialization, which only applies to endpoints with a response model; the
+endpoints that return plain dicts still go through stdlib json without this.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)